@@ -1,19 +1,45 @@
+import argparse
+import array
+import bisect
 import collections
 import colorsys
+import difflib
+import hashlib
+import heapq
 import itertools
-import mariadb
-import pylru
+import json
+import math
+import mmap
+import os
+import pickle
+import queue
+import random
+import re
+import sqlite3
 import struct
+import threading
 import time
 import tkinter
 import tkinter.font
 import tkinter.simpledialog
 import tkinter.ttk
+import zlib
 
 import sys
 import traceback
 import pprint
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# only DB needs the connector, a snapshot opens without it
+try:
+    import mariadb
+except ImportError:
+    mariadb = None
+
 class InfoDialog(tkinter.simpledialog.Dialog):
     def __init__(self, title, info, parent = None):
         if not parent:
@@ -53,7 +79,245 @@ def askintegerliteral(title, prompt, **kw):
     d = QueryIntegerLiteral(title, prompt, **kw)
     return d.result
 
+COLORS = 256
+PALETTE = ["#{:02X}{:02X}{:02X}".format(*[int(c*255) for c in colorsys.hls_to_rgb(float(i) / COLORS, 0.5, 0.5)])
+    for i in range(COLORS)]
+
+# heat shades, 0 is no access then cold blue through to hot red
+HEATS = 64
+HEAT_PALETTE = ["#202020"] + ["#{:02X}{:02X}{:02X}".format(*[int(c*255) for c in colorsys.hls_to_rgb(
+    0.66 * (1.0 - float(i) / (HEATS - 2)), 0.25 + 0.3 * float(i) / (HEATS - 2), 0.8)]) for i in range(HEATS - 1)]
+
+def color_index(hue):
+    return int((hue % 1.0) * COLORS)
+
+def hex_bytes(data):
+    # "$0A, $1B, ..." formatted in bulk, data is any buffer, a memoryview slice avoids copies
+    return "$" + data.hex(",").upper().replace(",", ", $") if len(data) else ""
+
+class Statement(object):
+    # A query declared once by name. DB prepares it server side the first time a connection runs it
+    # and keeps that cursor, so later runs only send parameters. Parameters are always ? placeholders.
+    registry = collections.OrderedDict() # name:Statement
+
+    def __init__(self, name, sql):
+        if name in Statement.registry:
+            raise ValueError("statement {} declared twice".format(name))
+        if "%(" in sql:
+            raise ValueError("statement {} takes %(name)s parameters, use ?".format(name))
+        self.name = name
+        self.sql = sql
+        Statement.registry[name] = self
+
+    def __str__(self):
+        return self.sql
+
+class Line(object):
+    # one rendered line, color is an index into PALETTE or -1 for none
+    __slots__ = ("x", "address", "text", "color", "target")
+
+    def __init__(self, x, address, text, color, target):
+        self.x = x
+        self.address = address
+        self.text = text
+        self.color = color
+        self.target = sys.intern(target)
+
+    def __eq__(self, other):
+        return isinstance(other, Line) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+class AddressMeta(object):
+    __slots__ = ("function", "context", "function_start", "jump_to")
+
+    def __init__(self):
+        self.function = None
+        self.context = None
+        self.function_start = False
+        self.jump_to = None
+
+class MetadataStore(dict):
+    # address:AddressMeta, created on first access
+    def __missing__(self, address):
+        meta = self[address] = AddressMeta()
+        return meta
+
+class ViewState(object):
+    # a view position with the page that was rendered there
+    __slots__ = ("view", "fields", "items", "metadata", "label")
+
+    def __init__(self, view, fields, items, metadata, label):
+        self.view = view
+        self.fields = fields
+        self.items = items # None once the page may be stale
+        self.metadata = metadata
+        self.label = label
+
+class History(object):
+    # back/forward stacks of ViewState
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.back = []
+        self.forward = []
+
+    def push(self, state):
+        self.back.append(state)
+        del self.back[:-self.limit]
+        del self.forward[:]
+
+    def go_back(self, current):
+        if not self.back:
+            return None
+        self.forward.append(current)
+        return self.back.pop()
+
+    def go_forward(self, current):
+        if not self.forward:
+            return None
+        self.back.append(current)
+        return self.forward.pop()
+
+    def expire(self, states=()):
+        # annotations changed, restored positions have to render again
+        for state in itertools.chain(self.back, self.forward, states):
+            state.items = None
+            state.metadata = None
+
+class RenderCache(object):
+    # LRU of rendered lines bounded by their approximate size in bytes, not entry count
+    def __init__(self, capacity=4*1024*1024):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict() # key:(value, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def sizeof(value):
+        lines, meta = value
+        size = sys.getsizeof(value) + sys.getsizeof(lines) + sys.getsizeof(meta)
+        for line in lines:
+            size += sys.getsizeof(line) + sys.getsizeof(line.text)
+        if meta.function:
+            size += sys.getsizeof(meta.function)
+        return size
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        if key in self.entries:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__(self, key):
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def __setitem__(self, key, value):
+        self.discard(key)
+        size = self.sizeof(value)
+        if size > self.capacity:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.capacity:
+            old, (value, size) = self.entries.popitem(last=False)
+            self.size -= size
+
+    def __delitem__(self, key):
+        value, size = self.entries.pop(key)
+        self.size -= size
+
+    def discard(self, key):
+        if key in self.entries:
+            del self[key]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def report(self):
+        lookups = self.hits + self.misses
+        return "{} entries {:.1f}/{:.1f}KB hit rate {:.1%}".format(len(self.entries)
+            , self.size / 1024.0, self.capacity / 1024.0, float(self.hits) / lookups if lookups else 0.0)
+
+class PersistentCache(object):
+    # Second level under RenderCache, rendered lines pickled into a local SQLite file.
+    # Rows carry the data_version they were rendered at and are only served while it is current.
+    def __init__(self, path, stamp):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS lines"
+                        " ( view TEXT NOT NULL, smap INTEGER NOT NULL, saddress INTEGER NOT NULL"
+                        " , map INTEGER NOT NULL, address INTEGER NOT NULL"
+                        " , stamp INTEGER NOT NULL, value BLOB NOT NULL"
+                        " , PRIMARY KEY (view, smap, saddress, map, address)"
+                        " ) WITHOUT ROWID")
+        self.stamp = stamp
+        self.pending = {} # (scope, key):value, written in batches
+        self.batch = 256
+        # explain: skip
+        self.db.execute("DELETE FROM lines WHERE stamp != ?", (stamp,))
+        self.db.commit()
+
+    def get(self, scope, key):
+        if (scope, key) in self.pending:
+            return self.pending[(scope, key)]
+        # explain: skip
+        row = self.db.execute("SELECT value FROM lines"
+                              " WHERE view = ? AND smap = ? AND saddress = ? AND map = ? AND address = ? AND stamp = ?"
+                              , scope + key + (self.stamp,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, scope, key, value):
+        self.pending[(scope, key)] = value
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.db.executemany("INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?, ?, ?, ?)"
+                , [scope + key + (self.stamp, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                    for (scope, key), value in self.pending.items()])
+            self.pending.clear()
+        self.db.commit()
+
+    def advance(self, before, after, stale=None):
+        # one annotation batch moved data_version from before to after, rows it didn't
+        # touch stay valid, stale is [(scope, key)] or None when any row may be affected
+        if before != self.stamp or stale is None:
+            # or someone else wrote in between and nothing can be trusted
+            self.pending.clear()
+            # explain: skip
+            self.db.execute("DELETE FROM lines")
+        else:
+            for scope, key in stale:
+                self.pending.pop((scope, key), None)
+            self.flush()
+            # explain: skip
+            self.db.executemany("DELETE FROM lines WHERE view = ? AND smap = ? AND saddress = ? AND map = ? AND address = ?"
+                , [scope + key for scope, key in stale])
+            # explain: skip
+            self.db.execute("UPDATE lines SET stamp = ? WHERE stamp = ?", (after, before))
+        self.stamp = after
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+class CacheMiss(Exception):
+    # a line was needed that only the database can render
+    pass
+
 class TkinterView(object):
+    FRAME = 16  # ms between renders while scrolling
+    SETTLE = 80 # ms without scrolling before the page is rendered in full
+
     def __init__(self, yscroll=None, **kwargs):
         self.height = 0
         self.items = []
@@ -64,10 +328,33 @@ class TkinterView(object):
 
         self.yscroll = yscroll
         self.noyscroll = True
+        self.shown = False
+
+        # scrolling is coalesced to one render a frame, mid scroll only cached lines are drawn
+        self.scroll_target = None
+        self.scroll_frame = None
+        self.scroll_settle = None
+        self.scroll_missed = False
+        self.cache_only = False
 
         self.bind("<Configure>", self.resize)
         self.bind("<Expose>", self.draw)
+        self.bind("<Map>", self.show, add="+")
+
+    def show(self, event):
+        # nothing is queried until the view is first shown
+        if not self.shown:
+            self.shown = True
+            # let the window paint before the first page is generated
+            self.after_idle(self.first_page)
+
+    def first_page(self):
+        tic = time.time()
         self.update_geometry()
+        toc = time.time()
+        top = self.winfo_toplevel()
+        if hasattr(top, "startup_report"):
+            top.startup_report(type(self).__name__, toc - tic)
 
     def resize(self, event):
         self.height = event.height
@@ -80,8 +367,12 @@ class TkinterView(object):
     def item_generate(self):
         raise NotImplementedError()
 
-    def update_geometry(self):
-        self.item_generate()
+    def update_geometry(self, generate=True):
+        if not self.shown:
+            return
+
+        if generate:
+            self.item_generate()
 
         if self.yscroll and self.page_size:
             start = 0.0
@@ -120,25 +411,81 @@ class TkinterView(object):
 
     def yview(self, event, value, unit=None):
         if event == "moveto":
-            self.setfirst(int(self.items_len * float(value) + 0.5))
+            self.scroll_to(int(self.items_len * float(value) + 0.5))
         elif event == "scroll":
+            target = self.first_item if self.scroll_target is None else self.scroll_target
             if unit == "units":
-                self.setfirst(self.first_item + int(value))
+                self.scroll_to(target + int(value))
             elif unit == "wheel":
-                direction = (1, -1)[value < 0]
-                while value:
-                    self.setfirst(self.first_item + int(direction) * 5)
-                    self.update_idletasks()
-                    value -= direction
+                self.scroll_to(target + int(value) * 5)
             elif unit == "pages":
-                self.setfirst(self.first_item + int(value) * self.page_size)
+                self.scroll_to(target + int(value) * self.page_size)
+
+    def scroll_to(self, first):
+        # only the last position asked for within a frame is rendered
+        self.scroll_target = first
+        if self.scroll_frame is None:
+            self.scroll_frame = self.after(self.FRAME, self.scroll_render)
+        if self.scroll_settle is not None:
+            self.after_cancel(self.scroll_settle)
+        self.scroll_settle = self.after(self.SETTLE, self.scroll_settled)
+
+    def scroll_render(self):
+        self.scroll_frame = None
+        if self.scroll_target is None:
+            return
+        first, self.scroll_target = self.scroll_target, None
+        self.cache_only = True
+        state = self.frame_state()
+        try:
+            self.setfirst(first)
+            self.scroll_missed = False
+        except CacheMiss:
+            # the last frame stays up until scrolling settles, and so does what clicks look up in it
+            self.restore_frame(state)
+            self.scroll_missed = True
+        finally:
+            self.cache_only = False
+
+    def scroll_settled(self):
+        self.scroll_settle = None
+        if self.scroll_missed:
+            self.scroll_missed = False
+            self.update_geometry()
+
+    def frame_state(self):
+        # what item_generate replaces, item_generate empties items in place
+        return (self.first_item, list(self.items), self.items_len)
+
+    def restore_frame(self, state):
+        self.first_item, items, self.items_len = state
+        self.items[:] = items
 
 class DataView(TkinterView, tkinter.Listbox):
+    context_query = Statement("data context"
+                            , "SELECT context"
+                              "  FROM functions"
+                              " WHERE smap = ?"
+                              "   AND saddress = ?"
+                              "   AND map = ?"
+                              "   AND end >= ?"
+                              "   AND begin <= ?"
+                              " LIMIT 1")
+    comment_query = Statement("data comment"
+                            , "SELECT context, comment"
+                              "  FROM comments"
+                              " WHERE smap = 0"
+                              "   AND saddress = 0"
+                              "   AND map = ?"
+                              "   AND address = ?"
+                              "   AND context IN (0, ?)")
+
     def __init__(self, parent, cursor=None, **kwargs):
         if cursor is None:
             raise TypeError
 
         self.cursor = cursor
+        self.accesses = kwargs.pop("accesses", None) or AccessStore(cursor)
         self.csmap = 0
         self.csaddress = 0
         self.cmap = 0
@@ -186,62 +533,21 @@ class DataView(TkinterView, tkinter.Listbox):
         self.items_len = 0
 
         ptic = time.time()
-        count_query = ("SELECT COUNT(*)"
-                       "  FROM datamap"
-                       " WHERE csmap = ?"
-                       "   AND csaddress = ?"
-                       "   AND cmap = ?"
-                       "   AND caddress = ?")
-
-        tic = time.time()
-        self.cursor.execute(count_query, (self.csmap, self.csaddress, self.cmap, self.caddress))
-        self.items_len = self.cursor.fetchone()['COUNT(*)']
-        toc = time.time()
-        if toc - tic > 0.1:
-            print("JDB datamap len {}".format(toc - tic))
-
+        self.items_len = self.accesses.code_count(self.csmap, self.csaddress, self.cmap, self.caddress)
         if self.items_len == 0:
             return
 
-        first_query = ("SELECT dmap, daddress"
-                       "  FROM datamap"
-                       " WHERE csmap = ?"
-                       "   AND csaddress = ?"
-                       "   AND cmap = ?"
-                       "   AND caddress = ?"
-                       " ORDER BY dmap, daddress, readdata"
-                       " LIMIT ?, 1")
-        tic = time.time()
-        self.cursor.execute(first_query, (self.csmap, self.csaddress, self.cmap, self.caddress, self.first_item))
-        first = self.cursor.fetchone()
-        toc = time.time()
-        if toc - tic > 0.1:
-            print("JDB datamap first {}".format(toc - tic))
-
-        page_query = ("SELECT dm.dmap, dm.daddress, dm.readdata, IFNULL(c.comment, IFNULL(d.comment, '')) as comment"
-                      "  FROM datamap dm"
-                      "  LEFT JOIN functions f ON (f.smap = dm.csmap AND f.saddress = dm.csaddress AND f.map = dm.cmap AND f.begin <= dm.caddress AND dm.caddress <= f.end)"
-                      "  LEFT JOIN comments c ON (c.smap = 0 AND c.map = dm.dmap AND c.saddress = 0 AND c.address = dm.daddress AND c.context = f.context)"
-                      "  LEFT JOIN comments d ON (d.smap = 0 AND d.map = dm.dmap AND d.saddress = 0 AND d.address = dm.daddress AND d.context = 0)"
-                      " WHERE dm.csmap = ?"
-                      "   AND dm.csaddress = ?"
-                      "   AND dm.cmap = ?"
-                      "   AND dm.caddress = ?"
-                      "   AND (dm.dmap, dm.daddress) >= (?, ?)"
-                      " ORDER BY dm.dmap, dm.daddress, dm.readdata"
-                      " LIMIT ?")
-
-        tic = time.time()
-        self.cursor.execute(page_query, (self.csmap, self.csaddress, self.cmap, self.caddress
-            , first["dmap"], first["daddress"], str(self.page_size)))
-        rows = self.cursor.fetchall()
-        toc = time.time()
-        if toc - tic > 0.1:
-            print("JDB datamap data {}".format(toc - tic))
+        self.cursor.execute(self.context_query, (self.csmap, self.csaddress, self.cmap, self.caddress, self.caddress))
+        function = self.cursor.fetchone()
+        context = function['context'] if function else 0
 
         # For each address...
-        for row in rows:
-            dmap, readdata, daddress, comment = (row[k] for k in ['dmap', 'readdata', 'daddress', 'comment'])
+        for dmap, daddress, readdata in self.accesses.code_range(self.csmap, self.csaddress, self.cmap, self.caddress
+                , self.first_item, self.page_size):
+            # the function's context wins over the default one
+            self.cursor.execute(self.comment_query, (dmap, daddress, context))
+            comments = sorted((row['context'], row['comment'] or "") for row in self.cursor.fetchall())
+            comment = comments[-1][1] if comments else ""
             self.items.append("{} {} 0x{:06X} - {}".format(self.map_name[dmap], ['w','r'][readdata], daddress, comment))
 
         ptoc = time.time()
@@ -270,13 +576,17 @@ class CanvasView(TkinterView, tkinter.Canvas):
             raise TypeError
 
         self.cursor = cursor
+        self.history = None
         self.entry_address = None
         self.entry_target = None
         self.menu_address = None
-        self.metadata = collections.defaultdict(dict)
+        self.metadata = MetadataStore()
         self.max_address = 0
 
-        self.cache = pylru.lrucache(100)
+        self.cache = RenderCache(kwargs.pop("cache_bytes", 4*1024*1024))
+        self.store = None
+        self.byte_store = kwargs.pop("byte_store", None) or ByteStore(cursor)
+        self.accesses = kwargs.pop("accesses", None) or AccessStore(cursor)
         self.times = collections.defaultdict(dict)
 
         self.font = kwargs.pop("font", tkinter.font.Font())
@@ -306,11 +616,11 @@ class CanvasView(TkinterView, tkinter.Canvas):
             self.winfo_toplevel().event_generate("<<EntryActive>>")
             self.entry_target = target
             self.entry_address = self.menu_address
-            del self.cache[(1, self.entry_address)]
+            self.cache.discard((1, self.entry_address))
             self.update_geometry()
 
         def remove_entry(e):
-            del self.cache[(1, self.entry_address)]
+            self.cache.discard((1, self.entry_address))
             self.entry_target = None
             self.entry_address = None
             self.update_geometry()
@@ -321,47 +631,49 @@ class CanvasView(TkinterView, tkinter.Canvas):
         self.menu.add_command(label="Function", command=lambda:self.place_entry("Function"), state=tkinter.DISABLED)
         self.menu.add_separator()
         self.menu.add_command(label="Jump to"
-            , command=lambda:self.jump(self.metadata[self.menu_address]["Jump to"][1]), state=tkinter.DISABLED)
+            , command=lambda:self.jump(*reversed(self.metadata[self.menu_address].jump_to)), state=tkinter.DISABLED)
 
         def post_menu(event):
             canvas_xy = (self.canvasx(event.x), self.canvasy(event.y))
             self.menu_address = int(self.gettags(self.find_closest(*canvas_xy))[0])
-            state = tkinter.NORMAL if "Function Start" in self.metadata[self.menu_address] else tkinter.DISABLED
+            state = tkinter.NORMAL if self.metadata[self.menu_address].function_start else tkinter.DISABLED
             self.menu.entryconfig("Function", state=state)
-            state = tkinter.NORMAL if "Jump to" in self.metadata[self.menu_address] else tkinter.DISABLED
+            state = tkinter.NORMAL if self.metadata[self.menu_address].jump_to else tkinter.DISABLED
             self.menu.entryconfig("Jump to", state=state)
             self.menu.post(event.x_root, event.y_root)
         self.bind("<Button-3>", post_menu)
 
     def draw(self, event):
         self.delete("all")
-        for y, (x, address, text, color, target) in enumerate(self.items):
+        for y, line in enumerate(self.items):
             if (y * self.item_height) > self.winfo_height():
                 break
 
-            x = self.font.measure(' ' * x)
-            item = self.create_text(x, y * self.item_height, anchor=tkinter.NW, text=text, font=self.font
-                , tags=(str(address)))
+            x = self.font.measure(' ' * line.x)
+            item = self.create_text(x, y * self.item_height, anchor=tkinter.NW, text=line.text, font=self.font
+                , tags=(str(line.address)))
 
             x = self.font.measure(' ' * self.spacing)
-            if self.entry_address == address and self.entry_target == target:
+            if self.entry_address == line.address and self.entry_target == line.target:
                 self.entryframe.configure(width=self.xwidth - x - 1)
                 self.create_window(x, (y * self.item_height), anchor=tkinter.NW, window=self.entryframe)
                 self.entry.focus_set()
 
-            if color >= 0:
-                rgb = colorsys.hls_to_rgb(color, 0.5, 0.5)
-                fill = "#{:02X}{:02X}{:02X}".format(*[int(c*255) for c in rgb])
+            if line.color >= 0:
+                fill = PALETTE[line.color]
                 bbox = self.bbox(item)
                 bbox = (0, bbox[1], self.xwidth, bbox[3])
-                rectangle = self.create_rectangle(bbox, fill=fill, outline=fill, tags=(str(address)))
+                rectangle = self.create_rectangle(bbox, fill=fill, outline=fill, tags=(str(line.address)))
                 self.tag_lower(rectangle)
 
-    def update_geometry(self):
-        TkinterView.update_geometry(self)
+    def update_geometry(self, generate=True):
+        if not self.shown:
+            return
+
+        TkinterView.update_geometry(self, generate)
 
         window_width = max(self.winfo_reqwidth(), self.winfo_width())
-        self.xwidth = max([self.font.measure(' ' * x + text) for (x, address, text, color, target) in self.items]
+        self.xwidth = max([self.font.measure(' ' * line.x + line.text) for line in self.items]
             + [window_width])
 
         self.xpos = min(self.xpos, self.xwidth - window_width)
@@ -406,13 +718,226 @@ class CanvasView(TkinterView, tkinter.Canvas):
             elif unit == "pages":
                 self.setxpos(self.xpos + int(value) * self.winfo_width())
 
-    def jump(self, addr):
+    def jump(self, addr, map=None):
         raise NotImplementedError()
 
+    def store_scope(self):
+        return (type(self).__name__, 0, 0)
+
+    def cache_get(self, key, persist=True):
+        if key in self.cache:
+            return self.cache[key]
+        value = None
+        if self.store is not None and persist:
+            value = self.store.get(self.store_scope(), key)
+            if value is not None:
+                self.cache[key] = value
+        if value is None and self.cache_only:
+            raise CacheMiss(key)
+        return value
+
+    def cache_put(self, key, value, persist=True):
+        self.cache[key] = value
+        if self.store is not None and persist:
+            self.store.put(self.store_scope(), key, value)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    state_fields = ("first_item", "items_len", "xpos")
+
+    def label(self):
+        return "{:06X}".format(self.first_item)
+
+    def frame_state(self):
+        return (TkinterView.frame_state(self), MetadataStore(self.metadata))
+
+    def restore_frame(self, state):
+        TkinterView.restore_frame(self, state[0])
+        self.metadata.clear()
+        self.metadata.update(state[1])
+
+    def snapshot(self):
+        return ViewState(self, {k:getattr(self, k) for k in self.state_fields}
+            , tuple(self.items), MetadataStore(self.metadata), self.label())
+
+    def restore(self, state):
+        for k, v in state.fields.items():
+            setattr(self, k, v)
+        if state.items is None:
+            self.update_geometry()
+        else:
+            self.items = list(state.items)
+            self.metadata = MetadataStore(state.metadata)
+            self.update_geometry(generate=False)
+
+    def record_jump(self):
+        if self.history is not None:
+            self.history.push(self.snapshot())
+        self.winfo_toplevel().event_generate("<<UpdateJumpList>>")
+
+class SNESAddressSpace(object):
+    # (banks, first, last, map, subtract, mask) in the order the old deMMIO chain tested them,
+    # an address in range maps to (map, (address - subtract) & mask)
+    SYSTEM = ((0x00, 0x3f), (0x80, 0xbf))
+    RULES = (
+          (SYSTEM, 0x2100, 0x213f, 5, 0, 0xffff) # PPU
+        , (SYSTEM, 0x2140, 0x217f, 5, 0, 0xffff) # APU
+        , (SYSTEM, 0x2180, 0x2183, 5, 0, 0xffff) # CPU
+        , (SYSTEM, 0x4016, 0x4017, 5, 0, 0xffff)
+        , (SYSTEM, 0x4200, 0x421f, 5, 0, 0xffff)
+        , (SYSTEM, 0x4300, 0x437f, 5, 0, 0xffff) # DMA
+        , (SYSTEM, 0x0000, 0x1fff, 2, 0, 0xffff) # WRAM
+        , (((0x7e, 0x7f),), 0x0000, 0xffff, 2, 0x7e0000, 0xffffff)
+        , (((0x00, 0x3f),), 0x8000, 0xffff, 1, 0, 0xffffff) # CART ROM
+        , (((0x80, 0xbf),), 0x8000, 0xffff, 1, 0x800000, 0xffffff)
+        , (((0x40, 0x7d),), 0x0000, 0xffff, 1, 0x400000, 0xffffff)
+        , (((0xc0, 0xff),), 0x0000, 0xffff, 1, 0xc00000, 0xffffff)
+        , (((0x20, 0x3f), (0xa0, 0xbf)), 0x6000, 0x7fff, 3, 0x6000, 0xffff) # CART SRAM
+        )
+    FINE = 0xff
+
+    def __init__(self):
+        # rule 0 is unmapped, pages holds a rule per 256 byte page of the 24-bit space
+        # or FINE when rules split the page, then fine holds a rule per byte
+        self.maps = [None] + [r[3] for r in self.RULES]
+        self.subs = [0] + [r[4] for r in self.RULES]
+        self.masks = [0] + [r[5] for r in self.RULES]
+        self.pages = bytearray()
+        self.fine = {}
+
+        rows = {}
+        for bank in range(0x100):
+            rules = tuple(i + 1 for i, r in enumerate(self.RULES) if any(lo <= bank <= hi for lo, hi in r[0]))
+            if rules not in rows:
+                rows[rules] = self.bank_generate(rules)
+            row, fine = rows[rules]
+            self.pages += row
+            for page, entries in fine.items():
+                self.fine[(bank << 8) | page] = entries
+
+        self.np = None
+        if numpy is not None:
+            self.np = self.numpy_generate()
+
+    def bank_generate(self, rules):
+        row = bytearray(0x100)
+        fine = {}
+        for page in range(0x100):
+            lo = page << 8
+            hi = lo + 0xff
+            touching = [i for i in rules if self.RULES[i - 1][1] <= hi and self.RULES[i - 1][2] >= lo]
+            if not touching:
+                continue
+            first = self.RULES[touching[0] - 1]
+            if first[1] <= lo and hi <= first[2]:
+                row[page] = touching[0]
+                continue
+            row[page] = self.FINE
+            fine[page] = bytes(next((i for i in touching if self.RULES[i - 1][1] <= a <= self.RULES[i - 1][2]), 0)
+                for a in range(lo, hi + 1))
+        return (row, fine)
+
+    def rule(self, address):
+        i = self.pages[address >> 8]
+        if i == self.FINE:
+            i = self.fine[address >> 8][address & 0xff]
+        return i
+
+    def map(self, address):
+        i = self.rule(address)
+        if not i:
+            return (None, None)
+        return (self.maps[i], (address - self.subs[i]) & self.masks[i])
+
+    def map_all(self, addresses):
+        rule = self.rule
+        maps, subs, masks = self.maps, self.subs, self.masks
+        result_maps = []
+        result_addresses = []
+        for address in addresses:
+            i = rule(address)
+            result_maps.append(maps[i])
+            result_addresses.append((address - subs[i]) & masks[i] if i else None)
+        return (result_maps, result_addresses)
+
+    def numpy_generate(self):
+        fine_pages = sorted(self.fine)
+        fine_row = numpy.zeros(len(self.pages), dtype=numpy.uint32)
+        fine_row[fine_pages] = numpy.arange(len(fine_pages))
+        return {"pages":numpy.frombuffer(bytes(self.pages), dtype=numpy.uint8)
+              , "fine":numpy.frombuffer(b"".join(self.fine[p] for p in fine_pages), dtype=numpy.uint8).reshape(-1, 0x100)
+              , "fine_row":fine_row
+              , "maps":numpy.array([m or 0 for m in self.maps], dtype=numpy.uint8)
+              , "subs":numpy.array(self.subs, dtype=numpy.int64)
+              , "masks":numpy.array(self.masks, dtype=numpy.int64)}
+
+    def map_array(self, addresses):
+        # numpy only, unmapped addresses come back as map 0
+        np = self.np
+        addresses = numpy.asarray(addresses, dtype=numpy.int64)
+        rules = np["pages"][addresses >> 8]
+        split = rules == self.FINE
+        if split.any():
+            a = addresses[split]
+            rules[split] = np["fine"][np["fine_row"][a >> 8], a & 0xff]
+        return (np["maps"][rules], (addresses - np["subs"][rules]) & np["masks"][rules])
+
+ADDRESS_SPACE = SNESAddressSpace()
+
 class ASMView(CanvasView):
+    # TODO WRAM and context
+    function_query = Statement("asm function"
+                             , "SELECT name, context"
+                               "  FROM functions"
+                               " WHERE smap = ?"
+                               "   AND saddress = ?"
+                               "   AND map = ?"
+                               "   AND begin = ?")
+    call_query = Statement("asm call"
+                         , "SELECT f.map, f.begin, f.name"
+                           "  FROM calls c"
+                           "  LEFT JOIN functions f ON (c.fsmap = f.smap AND c.fsaddress = f.saddress"
+                           "                       AND c.fmap = f.map AND c.faddress = f.begin)"
+                           " WHERE c.smap = ?"
+                           "   AND c.saddress = ?"
+                           "   AND c.map = ?"
+                           "   AND c.address = ?")
+    data_query = Statement("asm data comment"
+                         , "SELECT context, comment"
+                           "  FROM comments"
+                           " WHERE map = ?"
+                           "   AND address = ?"
+                           "   AND context IN (0, ?)")
+    page_function_query = Statement("asm page functions"
+                                  , "SELECT f.map, f.begin, f.end, f.name, f.context, CAST(f.row_num AS DOUBLE) / c.cnt AS color"
+                                    "  FROM (SELECT *, ROW_NUMBER() OVER (ORDER BY begin) row_num FROM functions) f"
+                                    "     , (SELECT COUNT(*) AS cnt FROM functions) c"
+                                    " WHERE f.smap = ?"
+                                    "   AND f.saddress = ?"
+                                    "   AND f.map = ?"
+                                    "   AND f.begin <= ?"
+                                    "   AND f.end >= ?")
+    page_comment_query = Statement("asm page comments"
+                                 , "SELECT map, address, context, comment"
+                                   "  FROM comments"
+                                   " WHERE smap = ?"
+                                   "   AND saddress = ?"
+                                   "   AND map = ?"
+                                   "   AND address >= ?"
+                                   "   AND address <= ?"
+                                   " ORDER BY context DESC")
+
     def __init__(self, parent, cursor=None, **kwargs):
         self.smap = 0
         self.saddress = 0
+        self.first = None
+        self.segments = None # ([map], [first ordinal of each map] + [items_len])
+        self.block_row = 0 # first row shown of a long data block at the top of the page
+        self.block_rows = 0
+        self.structs = None
+        self.symbols = None
+        self.code_map = None
         self.map_name = {1:"ROM", 2:"WRAM", 3:"SRAM", 4:"VRAM", 5:"REG"
                         ,"ROM":1, "WRAM":2, "SRAM":3, "VRAM":4, "REG":5}
         CanvasView.__init__(self, parent, cursor, **kwargs)
@@ -428,30 +953,7 @@ class ASMView(CanvasView):
         self.bind("<ButtonRelease-1>", publishaddress)
 
     def deMMIO(self, address):
-        bank = address >> 16
-        page = address & 0xFFFF
-        # PPU
-        if   (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2100 <= page <= 0x213f): return (5, page)
-        # APU
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2140 <= page <= 0x217f): return (5, page)
-        # CPU
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2180 <= page <= 0x2183): return (5, page)
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4016 <= page <= 0x4017): return (5, page)
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4200 <= page <= 0x421f): return (5, page)
-        # DMA
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4300 <= page <= 0x437f): return (5, page)
-        # WRAM
-        elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x0000 <= page <= 0x1fff): return (2, page)
-        elif (0x7e <= bank <= 0x7f) and (0x0000 <= page <= 0xffff): return (2, address - 0x7e0000)
-        # CART ROM
-        elif (0x00 <= bank <= 0x3f) and (0x8000 <= page <= 0xffff): return (1, address)
-        elif (0x80 <= bank <= 0xbf) and (0x8000 <= page <= 0xffff): return (1, address - 0x800000)
-        elif (0x40 <= bank <= 0x7d) and (0x0000 <= page <= 0xffff): return (1, address - 0x400000)
-        elif (0xc0 <= bank <= 0xff) and (0x0000 <= page <= 0xffff): return (1, address - 0xc00000)
-        # CART SRAM
-        elif (0x20 <= bank <= 0x3f or 0xa0 <= bank <= 0xbf) and (0x6000 <= page <= 0x7fff):
-            return (3, (address - 0x6000) & 0xffff)
-        return (None, None)
+        return ADDRESS_SPACE.map(address)
 
     def AB(pc, m, x, code): return "${:02X}{:02X}".format(code[2], code[1])
     def AIIX(pc, m, x, code): return "(${:02X}{:02X},X)".format(code[2], code[1])
@@ -512,170 +1014,87 @@ class ASMView(CanvasView):
         self.metadata.clear()
 
         ptic = time.time()
-        count_query = ("SELECT COUNT(*)"
-                       "  FROM (SELECT 1"
-                       "          FROM codemap cm"
-                       "         WHERE cm.smap = %(smap)s"
-                       "           AND cm.saddress = %(saddress)s"
-                       " UNION ALL"
-                       "        SELECT 1"
-                       "          FROM comments c"
-                       "         WHERE c.length IS NOT NULL"
-                       "           AND c.smap = %(smap)s"
-                       "           AND c.saddress = %(saddress)s"
-                       "       ) u")
-
-        tic = time.time()
-        self.cursor.execute(count_query, {"smap":self.smap, "saddress":self.saddress})
-        self.items_len = self.cursor.fetchone()['COUNT(*)']
-        toc = time.time()
-        self.times["count"][-1] = toc - tic
+        if self.segments is None:
+            tic = time.time()
+            self.segments = self.segment_generate()
+            toc = time.time()
+            self.times["count"][-1] = toc - tic
+        maps, offsets = self.segments
+        self.items_len = offsets[-1]
 
         if self.items_len == 0:
             return
 
-        first_query = (" SELECT cm.map, cm.address"
-                       "   FROM codemap cm"
-                       "  WHERE cm.smap = %(smap)s"
-                       "    AND cm.saddress = %(saddress)s"
-                       " UNION ALL"
-                       " SELECT c.map, c.address"
-                       "   FROM comments c"
-                       "  WHERE c.length IS NOT NULL"
-                       "    AND c.smap = %(smap)s"
-                       "    AND c.saddress = %(saddress)s"
-                       " ORDER BY map, address"
-                       " LIMIT %(first_item)s, 1")
-        tic = time.time()
-        self.cursor.execute(first_query, {"smap":self.smap, "saddress":self.saddress, "first_item":self.first_item})
-        self.first = self.cursor.fetchone()
-        toc = time.time()
-        self.times["first"][-1] = toc - tic
-
-        page_query = (" SELECT 'code' as asmtype, cm.map, cm.address, cm.m, cm.x, NULL as length"
-                      "   FROM codemap cm"
-                      "  WHERE cm.smap = %(smap)s"
-                      "    AND cm.saddress = %(saddress)s"
-                      "    AND cm.map >= %(map)s"
-                      "    AND cm.address >= %(address)s"
-                      "  GROUP BY address"
-                      " UNION ALL"
-                      " SELECT 'data' as asmtype, c.map, c.address, NULL as m, NULL as x, c.length"
-                      "   FROM comments c"
-                      "  WHERE c.length IS NOT NULL"
-                      "    AND c.smap = %(smap)s"
-                      "    AND c.saddress = %(saddress)s"
-                      "    AND c.map = %(map)s"
-                      "    AND c.address >= %(address)s"
-                      " ORDER BY address"
-                      " LIMIT %(page_size)s")
+        # each map is a contiguous run of ordinals, first_item is found within its map
+        segment = min(bisect.bisect_right(offsets, self.first_item), len(maps)) - 1
+        listing = self.listing()
+        self.first = {"map":maps[segment], "address":listing.nth(maps[segment], self.first_item - offsets[segment])}
+
         tic = time.time()
-        self.cursor.execute(page_query, {"smap":self.smap, "saddress":self.saddress, "map":self.first["map"], "address":self.first["address"], "page_size":self.page_size})
-        rows = self.cursor.fetchall()
+        rows = listing.page(self.first["map"], self.first["address"], self.page_size)
         toc = time.time()
         self.times["page"][-1] = toc - tic
 
         if not rows:
             return
 
-        function_query = ("SELECT f.map, f.begin, f.end, f.name, f.context, f.row_num / c.cnt AS color"
-                          "  FROM (SELECT *, ROW_NUMBER() OVER (ORDER BY begin) row_num FROM functions) f"
-                          "     , (SELECT COUNT(*) AS cnt FROM functions) c"
-                          " WHERE f.smap = ?"
-                          "   AND f.saddress = ?"
-                          "   AND f.map = ?"
-                          "   AND f.begin <= ?"
-                          "   AND f.end >= ?")
-        tic = time.time()
-        self.cursor.execute(function_query, (self.smap, self.saddress, rows[0]["map"], rows[-1]["address"], rows[0]["address"]))
-        toc = time.time()
-        self.times["function 1"][self.first["address"]] = toc - tic
-        functions = self.cursor.fetchall()
+        self.block_rows = 0
+        definition = self.struct_at(rows[0]['map'], rows[0]['address'])
+        if definition:
+            self.block_rows = -(-int(rows[0]['length']) // definition.size)
+        elif rows[0]['asmtype'] == "data" and rows[0]['length'] > 4:
+            self.block_rows = -(-int(rows[0]['length']) // self.data_row_bytes())
+        self.block_row = min(self.block_row, max(self.block_rows - 1, 0))
 
-        comment_query = ("SELECT address, context, comment"
-                         "  FROM comments"
-                         " WHERE smap = ?"
-                         "   AND saddress = ?"
-                         "   AND map = ?"
-                         "   AND address >= ?"
-                         "   AND address <= ?"
-                         " ORDER BY context DESC")
-        tic = time.time()
-        self.cursor.execute(comment_query, (self.smap, self.saddress, rows[0]["map"], rows[0]["address"], rows[-1]["address"]))
-        toc = time.time()
-        self.times["comment"][self.first["address"]] = toc - tic
-        comments = self.cursor.fetchall()
+        functions = None
+        comments = None
 
         # For each address...
         for row in rows:
-            asmtype, map, address, m, x, length = (row[k] for k in ['asmtype', 'map', 'address', 'm', 'x', 'length'])
+            asmtype, map, address, m, x, length, states = (row[k] for k in ['asmtype', 'map', 'address', 'm', 'x', 'length', 'states'])
 
             if len(self.items) > self.page_size:
                 break
 
-            if (map, address) in self.cache:
-                line, meta = self.cache[(map, address)]
+            # a data block scrolled into is only cached from its first row
+            block_row = self.block_row if (map, address) == (self.first["map"], self.first["address"]) else 0
+
+            # lines rendered around the entry are placeholders, only kept for this session
+            if block_row and self.cache_only:
+                raise CacheMiss((map, address))
+            cached = None if block_row else self.cache_get((map, address), persist=address != self.entry_address)
+            if cached:
+                line, meta = cached
                 if not self.items or line[0] != self.items[-1]:
                     self.items += line
                     self.metadata[address] = meta
                 continue
 
-            # TODO WRAM and context
-            bytes_query = ("SELECT byte"
-                           "  FROM bytes"
-                           " WHERE smap = %(smap)s"
-                           "   AND saddress = %(saddress)s"
-                           "   AND map = %(map)s"
-                           "   AND address >= %(address)s + 0"
-                           "   AND address <= %(address)s + %(length)s"
-                           " ORDER BY address")
-            function_query = ("SELECT name, context"
-                              "  FROM functions"
-                              " WHERE smap = ?"
-                              "   AND saddress = ?"
-                              "   AND map = ?"
-                              "   AND begin = ?")
-            call_query = ("SELECT f.map, f.begin, f.name"
-                          "  FROM calls c"
-                          "  LEFT JOIN functions f ON (c.fsmap = f.smap AND c.fsaddress = f.saddress"
-                          "                       AND c.fmap = f.map AND c.faddress = f.begin)"
-                          " WHERE c.smap = ?"
-                          "   AND c.saddress = ?"
-                          "   AND c.map = ?"
-                          "   AND c.address = ?")
-            data_query = (" WITH ranked_messages AS ("
-                          "   SELECT c.context, dm.dmap, c.comment, ROW_NUMBER() OVER (PARTITION BY dm.dmap ORDER BY c.context DESC, dm.daddress) AS rn"
-                          "     FROM (SELECT DISTINCT dmap, daddress"
-                          "             FROM datamap"
-                          "            WHERE csmap = ? AND csaddress = ? AND cmap = ? AND caddress = ?"
-                          "            GROUP BY dmap) dm"
-                          "     LEFT JOIN comments c ON (c.map = dm.dmap AND c.address = dm.daddress AND c.context IN (0, ?))"
-                          " )"
-                          " SELECT context, dmap, IFNULL(comment, '') as comment FROM ranked_messages WHERE rn = 1;")
+            if functions is None:
+                functions, comments = self.page_annotations(rows)
 
             line = []
 
             # Colorize
-            function = [f for f in functions if f['begin'] <= row['address'] and row['address'] <= f['end']]
+            function = [f for f in functions if f['map'] == map and f['begin'] <= address and address <= f['end']]
             if function:
-                color = float(function[0]['color']) * 16
-                self.metadata[address]["Function"] = function[0]['name']
-                self.metadata[address]["Context"] = function[0]['context']
+                color = color_index(float(function[0]['color']) * 16)
+                self.metadata[address].function = function[0]['name']
+                self.metadata[address].context = function[0]['context']
             else:
-                color = -1.0
+                color = -1
 
             # Retrieve bytes
             tic = time.time()
-            self.cursor.execute(bytes_query, {"smap":self.smap, "saddress":self.saddress, "map":map, "address":address, "length":3})
+            code = list(self.byte_store.read(self.smap, self.saddress, map, address, 4))
             toc = time.time()
             self.times["bytes"][address] = toc - tic
-            code = [sublist['byte'] for sublist in self.cursor]
 
             # Function start
             if asmtype == "code":
                 if function and map == function[0]['map'] and address == function[0]['begin']:
-                    line.append([self.spacing, address, function[0]['name'] + "()", color, "Function"])
-                    self.metadata[address]["Function Start"] = True
+                    line.append(Line(self.spacing, address, function[0]['name'] + "()", color, "Function"))
+                    self.metadata[address].function_start = True
                     if self.entry_address == address and self.entry_target == "Function":
                         self.entry.delete(0, tkinter.END)
                         self.entry.insert(0, function[0]['name'])
@@ -692,13 +1111,13 @@ class ASMView(CanvasView):
                     (fmap, faddress) = self.deMMIO(faddress)
                 if faddress:
                     tic = time.time()
-                    self.cursor.execute(function_query, (self.smap, self.saddress, fmap, faddress))
+                    self.cursor.execute(self.function_query, (self.smap, self.saddress, fmap, faddress))
                     toc = time.time()
                     self.times["function 2"][address] = toc - tic
                     call = self.cursor.fetchone()
                     if call:
-                        line.append([self.spacing, address, "Call " + call['name'] + "()", color, "Call"])
-                    self.metadata[address]["Jump to"] = (fmap, faddress)
+                        line.append(Line(self.spacing, address, "Call " + call['name'] + "()", color, "Call"))
+                    self.metadata[address].jump_to = (fmap, faddress)
 
             # Implicit function call
             if asmtype == "code":
@@ -707,55 +1126,78 @@ class ASMView(CanvasView):
                 jsr = (0x20, 0x22, 0xfc)
                 if code[0] in branches + jumps + jsr:
                     tic = time.time()
-                    self.cursor.execute(call_query, (self.smap, self.saddress, map, address))
+                    self.cursor.execute(self.call_query, (self.smap, self.saddress, map, address))
                     toc = time.time()
                     self.times["call"][address] = toc - tic
                     call = self.cursor.fetchone()
                     if call:
-                        line.append([self.spacing, address, "Call " + call['name'] + "()", color, "Call"])
-                        self.metadata[address]["Jump to"] = (call['map'], call['begin'])
-                if "Jump to" not in self.metadata[address]:
+                        line.append(Line(self.spacing, address, "Call " + call['name'] + "()", color, "Call"))
+                        self.metadata[address].jump_to = (call['map'], call['begin'])
+                if not self.metadata[address].jump_to:
                     if code[0] in branches + (0x4C, 0x5C): # JMP JML
                         jumpaddress = int(self.decoder[code[0]][1](address, m, x, code)[1:], 16)
                         if code[0] != 0x5C: # JML
                             jumpaddress = (address & 0xFF0000) + jumpaddress
-                        self.metadata[address]["Jump to"] = (map, jumpaddress)
+                        self.metadata[address].jump_to = (map, jumpaddress)
 
             # Line comments
-            comment = [c for c in comments if c["address"] == address]
+            comment = [c for c in comments if c["map"] == map and c["address"] == address]
             if comment:
-                line.append([self.spacing, address, comment[0]['comment'], color, "Comment"])
+                line.append(Line(self.spacing, address, comment[0]['comment'], color, "Comment"))
             elif self.entry_address == address:
-                line.append([self.spacing, address, "", color, "Comment"])
+                line.append(Line(self.spacing, address, "", color, "Comment"))
 
             if self.entry_address == address and self.entry_target == "Comment":
                 self.entry.delete(0, tkinter.END)
                 if comment:
                     self.entry.insert(0, comment[0]['comment'])
 
+            # Flag states the address was also decoded under
+            if len(states) > 1:
+                line.append(Line(self.spacing, address, "Also m/x " + ", ".join("{}/{}".format(*state)
+                    for state in states if state != (m, x)), color, "Decode"))
+
             # Data I/O comment
             if asmtype == "code":
                 tic = time.time()
-                self.cursor.execute(data_query, (self.smap, self.saddress, map, address, function[0]["context"] if function else 0))
+                # one line per data map touched, about its lowest address
+                accessed = {}
+                for dmap, daddress, readdata in self.accesses.code_range(self.smap, self.saddress, map, address):
+                    accessed.setdefault(dmap, daddress)
+                for dmap, daddress in sorted(accessed.items()):
+                    self.cursor.execute(self.data_query, (dmap, daddress, function[0]["context"] if function else 0))
+                    io_comments = sorted((row['context'], row['comment'] or "") for row in self.cursor.fetchall())
+                    line.append(Line(self.spacing, address, "{} - {}".format(self.map_name[dmap], io_comments[-1][1] if io_comments else ""), color, "IO"))
                 toc = time.time()
                 self.times["data"][address] = toc - tic
-                for data in self.cursor:
-                    line.append([self.spacing, address, "{} - {}".format(self.map_name[data['dmap']], data['comment']), color, "IO"])
 
             # Decode
             text = "{:{}}".format("Error", self.spacing)
             if asmtype == "code":
-                text = "{:06X} {} {}".format(address
-                    # mnemonic                  addressing mode
-                    , self.decoder[code[0]][0], self.decoder[code[0]][1](address, m, x, code))
+                mnemonic, mode = self.decoder[code[0]]
+                operand = mode(address, m, x, code)
+                if self.symbols:
+                    operand = self.symbols.operand(self.smap, self.saddress, map, address, mode, code, operand)
+                text = "{:06X} {} {}".format(address, mnemonic, operand)
                 # Alternate mnemonics
-                if "BCC" in text and self.items and any(x in self.items[-1][2] for x in ("BEQ", "CMP", "CPX", "CPY")):
+                if "BCC" in text and self.items and any(x in self.items[-1].text for x in ("BEQ", "CMP", "CPX", "CPY")):
                     text = text.replace("BCC", "BLT")
-                if "BCS" in text and self.items and any(x in self.items[-1][2] for x in ("BEQ", "CMP", "CPX", "CPY")):
+                if "BCS" in text and self.items and any(x in self.items[-1].text for x in ("BEQ", "CMP", "CPX", "CPY")):
                     text = text.replace("BCS", "BGE")
 
             elif asmtype == "data":
-                if length in (1, 2, 3, 4):
+                definition = self.struct_at(map, address)
+                if definition:
+                    for record, values in self.structs.records(self.smap, self.saddress, map, address
+                            , block_row, max(self.page_size, 1)):
+                        row = "{:06X} {}[{}] {}".format(record, definition.name, (record - address) // definition.size
+                            , definition.text(values))
+                        self.metadata[record].jump_to = definition.jump_to(map, record, values)
+                        if "Error" in text:
+                            text = row
+                        else:
+                            line.append(Line(0, record, row, color, "Decode"))
+                elif length in (1, 2, 3, 4):
                     length = int(length)
                     ba = code[0:length] + ([0] if length == 3 else [])
                     text = "{:06X} D{} ${num:0{width}X}".format(address
@@ -764,43 +1206,32 @@ class ASMView(CanvasView):
                             , bytearray(ba))[0]
                         , width=length*2)
                 else:
-                    # Retrieve bytes
                     tic = time.time()
-                    self.cursor.execute(bytes_query, {"smap":self.smap, "saddress":self.saddress, "map":map, "address":address, "length":length - 1})
+                    start, block = self.data_block(map, address, int(length), block_row)
                     toc = time.time()
                     self.times["big bytes"][address] = toc - tic
 
-                    array = "{:06X} DB ".format(address)
-                    data_spacing = len(array)
-                    max_len = self.winfo_width() - self.font.measure("$00, ")
-                    for data in self.cursor:
-                        if self.font.measure(array) > max_len:
-                            if "Error" in text:
-                                text = array[:-1]
-                                max_len -= self.font.measure(' ' * data_spacing)
-                            else:
-                                line.append([data_spacing, address, array[:-1], color, "Decode"])
-                                if (len(line) * self.item_height) > self.winfo_height():
-                                    self.cursor.fetchall()
-                                    break
-                            array = ""
-                        array += "${:02X}, ".format(data['byte'])
-                    if "Error" in text:
-                        text = array[:-2]
-                    else:
-                        line.append([data_spacing, address, array[:-2], color, "Decode"])
+                    data_spacing = len("{:06X} DB ".format(address))
+                    if block:
+                        text = "{:06X} DB {}".format(start, block[0])
+                        for row in block[1:]:
+                            line.append(Line(data_spacing, address, row, color, "Decode"))
             if len(line):
-                line[0][0] = 0
-                line[0][2] = "{:{}} {}".format(text, self.spacing - 1, line[0][2])
+                line[0].x = 0
+                line[0].text = "{:{}} {}".format(text, self.spacing - 1, line[0].text)
             else:
-                line.append([0, address, text, color, "Decode"])
+                line.append(Line(0, address, text, color, "Decode"))
 
-            self.cache[(map, address)] = (line, self.metadata[address])
+            line = tuple(line)
+            # struct records keep their pointers in per-record metadata, which isn't cached
+            if not block_row and not (asmtype == "data" and definition):
+                self.cache_put((map, address), (line, self.metadata[address]), persist=address != self.entry_address)
             self.items += line
 
         ptoc = time.time()
         if ptoc - ptic > 0.3:
             print("JDB code page", ptoc - ptic, 1, self.first["address"])
+            print("CACHE", self.cache.report())
             print("AVG", {k:sum(v.values())/len(v) for k, v in list(self.times.items())})
             print("MAX", {k:max(v.values()) for k, v in list(self.times.items())})
             sums = {k:sum(v.values()) for k, v in list(self.times.items())}
@@ -812,49 +1243,135 @@ class ASMView(CanvasView):
                 pprint.pprint(self.times["data"])
             print()
 
+    def page_annotations(self, rows):
+        # functions and comments of the page, only queried once a line has to be rendered
+        functions = []
+        comments = []
+        for map, group in itertools.groupby(rows, key=lambda row: row['map']):
+            group = list(group)
+            tic = time.time()
+            self.cursor.execute(self.page_function_query, (self.smap, self.saddress, map, group[-1]["address"], group[0]["address"]))
+            functions += self.cursor.fetchall()
+            toc = time.time()
+            self.times["function 1"][(map, group[0]["address"])] = toc - tic
+
+            tic = time.time()
+            self.cursor.execute(self.page_comment_query, (self.smap, self.saddress, map, group[0]["address"], group[-1]["address"]))
+            comments += self.cursor.fetchall()
+            toc = time.time()
+            self.times["comment"][(map, group[0]["address"])] = toc - tic
+
+        return (functions, comments)
+
+    def struct_at(self, map, address):
+        return self.structs.at(self.smap, self.saddress, map, address) if self.structs else None
+
+    def data_row_bytes(self):
+        # bytes per row of a long data block, rows are indented past the "XXXXXX DB " prefix
+        cell = self.font.measure("$00, ")
+        return max(1, (self.winfo_width() - self.font.measure(" " * len("000000 DB "))) // cell)
+
+    def data_block(self, map, address, length, row=0):
+        # formatted rows of a data block from row on, only a page of rows is fetched
+        per_row = self.data_row_bytes()
+        begin = address + row * per_row
+        end = min(address + length, begin + per_row * max(self.page_size, 1))
+        data = self.byte_store.read(self.smap, self.saddress, map, begin, end - begin)
+
+        rows = [hex_bytes(data[i:i + per_row]) for i in range(0, len(data), per_row)]
+        # every row but the block's last ends in a comma, as if the block were one list
+        for i in range(len(rows)):
+            if begin + (i + 1) * per_row < address + length:
+                rows[i] += ","
+        return (begin, rows)
+
+    def frame_state(self):
+        return (CanvasView.frame_state(self), self.first, self.block_row, self.block_rows)
+
+    def restore_frame(self, state):
+        CanvasView.restore_frame(self, state[0])
+        self.first, self.block_row, self.block_rows = state[1:]
+
+    def setfirst(self, first):
+        # a new first item starts at its first row
+        before, row = self.first_item, self.block_row
+        self.block_row = 0
+        CanvasView.setfirst(self, first)
+        if self.first_item == before:
+            self.block_row = row
+
+    def yview(self, event, value, unit=None):
+        # line and wheel scrolling step through the rows of a long data block before leaving it
+        if event == "scroll" and unit in ("units", "wheel") and self.block_rows:
+            row = self.block_row + int(value) * (5 if unit == "wheel" else 1)
+            if row < 0 < self.block_row:
+                row = 0
+            if 0 <= row < self.block_rows:
+                self.block_row = row
+                self.update_geometry()
+                return
+        CanvasView.yview(self, event, value, unit)
+
+    def listing(self):
+        if self.code_map is None or self.code_map.source != (self.smap, self.saddress):
+            self.code_map = CodeMap(self.cursor, self.smap, self.saddress)
+        return self.code_map
+
+    def segment_generate(self):
+        listing = self.listing()
+        maps = [map for map in listing.maps() if listing.count(map)]
+        offsets = [0]
+        for map in maps:
+            offsets.append(offsets[-1] + listing.count(map))
+        return (maps, offsets)
+
+    def locate(self, map, address):
+        # ordinal of the first item at or after (map, address), None for an unlisted map
+        if self.segments is None:
+            self.segments = self.segment_generate()
+        maps, offsets = self.segments
+        if map not in maps:
+            return None
+        return offsets[maps.index(map)] + self.listing().ordinal(map, address)
+
+    def store_scope(self):
+        return (type(self).__name__, self.smap, self.saddress)
+
+    def invalidate(self):
+        CanvasView.invalidate(self)
+        self.segments = None
+        self.code_map = None
+
     def setsource(self, smap, saddress):
         if smap != self.smap or saddress != self.saddress:
             self.first_item = 0
             self.smap = smap
             self.saddress = saddress
+            self.segments = None
             self.update_geometry()
 
-    def jump(self, addr):
-        if addr == self.first["address"]:
+    state_fields = CanvasView.state_fields + ("smap", "saddress", "first", "segments", "block_row")
+
+    def label(self):
+        if not self.first:
+            return CanvasView.label(self)
+        return "{:06X} - {}".format(self.first["address"], self.metadata[self.first["address"]].function or "None")
+
+    def jump(self, addr, map=1):
+        if self.first and (map, addr) == (self.first["map"], self.first["address"]):
             return
 
-        self.winfo_toplevel().event_generate("<<UpdateJumpList>>")
+        self.record_jump()
 
-        first_query = ("SELECT row_num - 1 as item"
-                       "  FROM (SELECT ROW_NUMBER() OVER (ORDER BY address) AS row_num, address"
-                       "          FROM (SELECT address FROM codemap"
-                       "                 WHERE smap = %(smap)s"
-                       "                   AND saddress = %(saddress)s"
-                       "                 UNION ALL "
-                       "                SELECT address FROM comments"
-                       "                 WHERE length IS NOT NULL"
-                       "                   AND smap = %(smap)s"
-                       "                   AND saddress = %(saddress)s"
-                       "                 ORDER BY address) AS i) AS o"
-                       " WHERE address = %(address)s")
-        # TODO maps
-        self.cursor.execute(first_query, {"smap":self.smap, "saddress":self.saddress, "address":addr})
-        first_item = self.cursor.fetchall()
-
-        if len(first_item):
-            self.setfirst(first_item[0]['item'])
+        first = self.locate(map, addr) if self.listing().contains(map, addr) else None
+        if first is not None:
+            self.setfirst(first)
         else:
-            d = InfoDialog("Info", "Address {:06X} not mapped".format(addr), parent=self.winfo_toplevel())
+            d = InfoDialog("Info", "Address {}:{:06X} not mapped".format(self.map_name.get(map, map), addr), parent=self.winfo_toplevel())
 
 class ScriptView(CanvasView):
     def __init__(self, parent, cursor=None, **kwargs):
-        # TODO will probably need a type table in the future
-        source_query = ("SELECT MIN(saddress)"
-                       "   FROM bytes"
-                       "  WHERE type = 2")
-        cursor.execute(source_query)
-        self.smap = 1 # probably always 1
-        self.saddress = cursor.fetchone()['MIN(saddress)']
+        self.smap, self.saddress = kwargs.pop("sources").first(2)
         self.dirty = True
         self.buffered = []
         CanvasView.__init__(self, parent, cursor, **kwargs)
@@ -890,14 +1407,8 @@ class ScriptView(CanvasView):
             self.items_len = 0
 
             ptic = time.time()
-            script_query = ("SELECT byte"
-                            "  FROM bytes"
-                            " WHERE smap = ?"
-                            "   AND saddress = ?"
-                            " ORDER BY address")
             tic = time.time()
-            self.cursor.execute(script_query, (self.smap, self.saddress))
-            code = [row['byte'] for row in self.cursor]
+            code = list(self.byte_store.source(self.smap, self.saddress))
             toc = time.time()
             self.times["script"][-1] = toc - tic
 
@@ -909,11 +1420,11 @@ class ScriptView(CanvasView):
                 if address == 0x00:
                     event_count = struct.unpack("<B", bytearray(code[address:address+1]))[0]
                     text = "{:06X} ${:02X}".format(address, event_count)
-                    self.buffered.append([0, address, text, -1.0, "Script"])
+                    self.buffered.append(Line(0, address, text, -1, "Script"))
                 elif address < (event_count * 16 * 2):
                     text = "{:06X} ${:04X}".format(address, struct.unpack("<H", bytearray(code[address:address+2]))[0])
                     next(code_iter)
-                    self.buffered.append([0, address, text, -1.0, "Script"])
+                    self.buffered.append(Line(0, address, text, -1, "Script"))
                 else:
                     text = "{:06X} {:02X} {}".format(address, byte, self.decoder[byte][0])
                     def unpack_bytes(address, length):
@@ -937,7 +1448,7 @@ class ScriptView(CanvasView):
                         for length in self.decoder[byte][1]:
                             text += " ${num:0{width}X}".format(num=unpack_bytes(address+sum, length), width=length*2)
                             sum = sum + length
-                    self.buffered.append([0, address, text, -1.0, "Script"])
+                    self.buffered.append(Line(0, address, text, -1, "Script"))
 
             self.items_len = len(self.buffered)
             self.items = self.buffered[:self.page_size]
@@ -961,15 +1472,34 @@ class ScriptView(CanvasView):
             self.dirty = True
             self.update_geometry()
 
-    def jump(self, addr):
-        self.winfo_toplevel().event_generate("<<UpdateJumpList>>")
+    state_fields = CanvasView.state_fields + ("smap", "saddress")
+
+    def restore(self, state):
+        # the buffer only holds the current source
+        if (state.fields["smap"], state.fields["saddress"]) != (self.smap, self.saddress):
+            self.dirty = True
+            state.items = None
+        CanvasView.restore(self, state)
+
+    def jump(self, addr, map=None):
+        self.record_jump()
         self.setfirst(addr)
 
 class WRAMView(CanvasView):
+    comment_query = Statement("wram comments"
+                            , "SELECT address, comment"
+                              "  FROM comments"
+                              " WHERE smap = 0"
+                              "   AND saddress = 0"
+                              "   AND map = ?"
+                              "   AND address >= ?"
+                              "   AND address < ?")
+
     def __init__(self, parent, cursor=None, **kwargs):
         self.map_name = {1:"ROM", 2:"WRAM", 3:"SRAM", 4:"VRAM", 5:"REG"
                         ,"ROM":1, "WRAM":2, "SRAM":3, "VRAM":4, "REG":5}
 
+        self.callgraph = kwargs.pop("callgraph", None) or CallGraph(cursor)
         CanvasView.__init__(self, parent, cursor, **kwargs)
 
         self.items_len = 0x01ffff
@@ -981,22 +1511,9 @@ class WRAMView(CanvasView):
         self.metadata.clear()
 
         ptic = time.time()
-        page_query = ("SELECT dm.dmap, dm.daddress, dm.cmap, dm.caddress, f.name, c.comment"
-                      "  FROM datamap dm"
-                      "  LEFT JOIN functions f ON (dm.csmap = f.smap AND dm.csaddress = f.saddress"
-                      "                        AND dm.cmap = f.map AND dm.caddress >= f.begin AND dm.caddress <= f.end)"
-                      "  LEFT JOIN comments c ON (0 = c.smap AND 0 = c.saddress"
-                      "                       AND dm.dmap = c.map AND dm.daddress = c.address)"
-                      " WHERE dm.dmap = ?"
-                      "   AND dm.daddress >= ?"
-                      " ORDER BY                         dm.dmap, dm.daddress"
-                      "        , dm.csmap, dm.csaddress, dm.cmap, dm.caddress"
-                      " LIMIT ?")
-        tic = time.time()
-        self.cursor.execute(page_query, (2, self.first_item, self.page_size))
-        rows = self.cursor.fetchall()
-        toc = time.time()
-        self.times["query"][-1] = toc - tic
+        end = min(self.first_item + self.page_size, 0x20000)
+        rows = None
+        comments = None
 
         # For each address...
         i = 0
@@ -1004,35 +1521,47 @@ class WRAMView(CanvasView):
             if len(self.items) > self.page_size:
                 break
 
-            if (2, daddress) in self.cache:
-                line, meta = self.cache[(dmap, daddress)]
+            cached = self.cache_get((2, daddress))
+            if cached:
+                line, meta = cached
                 self.items += line
                 self.metadata[daddress] = meta
                 continue
 
+            if rows is None:
+                tic = time.time()
+                rows = self.accesses.data_range(2, self.first_item, end)
+                self.cursor.execute(self.comment_query, (2, self.first_item, end))
+                comments = {row['address']:row['comment'] for row in self.cursor.fetchall() if row['comment']}
+                toc = time.time()
+                self.times["query"][-1] = toc - tic
+
             line = []
 
-            # Decode
-            comment = ""
-            while i < len(rows) and rows[i]['daddress'] == daddress:
-                comment = rows[i]['comment'] if rows[i]['comment'] else ""
-                name = rows[i]['name'] + "()" if rows[i]['name'] else ""
-                line.append([self.spacing, daddress, "{}:{:06X} - {}".format(self.map_name[rows[i]['cmap']], rows[i]['caddress'], name), daddress / 16.0, "WRAM"])
+            # Decode, one line per instruction accessing the address
+            comment = comments.get(daddress, "")
+            while i < len(rows) and rows[i][0] == daddress:
+                site = rows[i][1]
+                function = self.callgraph.function_at(*site)
+                name = self.callgraph.name(function) + "()" if function else ""
+                line.append(Line(self.spacing, daddress, "{}:{:06X} - {}".format(self.map_name[site[2]], site[3], name), color_index(daddress / 16.0), "WRAM"))
                 i = i + 1
 
             text = "{:06X}".format(daddress)
             if len(line):
-                line[0][0] = 0
-                line[0][2] = "{:{}} {} {}".format(text, self.spacing - 1, line[0][2], comment)
+                line[0].x = 0
+                line[0].text = "{:{}} {} {}".format(text, self.spacing - 1, line[0].text, comment)
             else:
-                line.append([0, daddress, "{:{}} {}".format(text, self.spacing - 1, comment), daddress / 16.0, "WRAM"])
+                line.append(Line(0, daddress, "{:{}} {}".format(text, self.spacing - 1, comment), color_index(daddress / 16.0), "WRAM"))
 
-            self.cache[(map, daddress)] = (line, self.metadata[daddress])
+            line = tuple(line)
+            self.cache_put((2, daddress), (line, self.metadata[daddress]))
             self.items += line
 
         ptoc = time.time()
         if ptoc - ptic > 0.3:
             print("JDB WRAM page", ptoc - ptic)
+            print("CACHE", self.cache.report())
             print({k:sum(v.values())/len(v) for k, v in list(self.times.items())})
             print({k:max(v.values()) for k, v in list(self.times.items())})
             print({k:sum(v.values()) for k, v in list(self.times.items())})
@@ -1040,42 +1569,524 @@ class WRAMView(CanvasView):
             print(sum({k:sum(v.values()) for k, v in list(self.times.items())}.values()))
             print()
 
-    def jump(self, addr):
-        self.winfo_toplevel().event_generate("<<UpdateJumpList>>")
+    def jump(self, addr, map=None):
+        self.record_jump()
         self.setfirst(addr)
 
+class HeatmapView(tkinter.Canvas):
+    # access overview of a data map, a grid of cells each shaded by how many instructions
+    # touch its addresses. The wheel zooms a level of the pyramid in or out about the pointer.
+    SIZES = {2:0x20000, 3:0x2000, 5:0x8000}
+    CELL = 8
+
+    def __init__(self, parent, accesses, **kwargs):
+        tkinter.Canvas.__init__(self, parent, **kwargs)
+        self.accesses = accesses
+        self.dmap = 2
+        self.level = None # fit the whole map
+        self.first = 0 # first cell at level
+        self.bind("<Configure>", lambda e: self.redraw())
+        self.bind("<MouseWheel>", lambda e: self.zoom(e.x, e.y, e.delta > 0))
+        self.bind("<Button-4>", lambda e: self.zoom(e.x, e.y, True))
+        self.bind("<Button-5>", lambda e: self.zoom(e.x, e.y, False))
+
+    def grid_size(self):
+        return (max(1, self.winfo_width() // self.CELL), max(1, self.winfo_height() // self.CELL))
+
+    def pyramid(self):
+        return self.accesses.pyramid(self.dmap, self.SIZES[self.dmap])
+
+    def setmap(self, dmap):
+        self.dmap = dmap
+        self.level = None
+        self.first = 0
+        self.redraw()
+
+    def view(self):
+        # (level, first cell) on screen
+        columns, rows = self.grid_size()
+        fit = self.pyramid().fit(columns * rows)
+        if self.level is None or self.level >= fit:
+            return (fit, 0)
+        return (self.level, self.first)
+
+    def cell_at(self, x, y):
+        columns, rows = self.grid_size()
+        column, row = x // self.CELL, y // self.CELL
+        if not (0 <= column < columns and 0 <= row < rows):
+            return None
+        return row * columns + column
+
+    def address_at(self, x, y):
+        # (first address, last address, accesses) of the cell under x, y or None
+        cell = self.cell_at(x, y)
+        if cell is None:
+            return None
+        level, first = self.view()
+        counts = self.pyramid().levels[level]
+        if first + cell >= len(counts):
+            return None
+        address = (first + cell) << level
+        return (address, address + (1 << level) - 1, int(counts[first + cell]))
+
+    def zoom(self, x, y, closer):
+        cell = self.cell_at(x, y)
+        if cell is None:
+            return
+        columns, rows = self.grid_size()
+        level, first = self.view()
+        # keep the cell under the pointer in place
+        address = (first + cell) << level
+        level = level - 1 if closer else level + 1
+        if level < 0 or level > self.pyramid().fit(columns * rows):
+            return
+        self.level = level
+        self.first = max(0, min((address >> level) - cell, len(self.pyramid().levels[level]) - columns * rows))
+        self.redraw()
+
+    def redraw(self):
+        if not self.winfo_ismapped():
+            return
+        self.delete(tkinter.ALL)
+        columns, rows = self.grid_size()
+        level, first = self.view()
+        shades = self.pyramid().shades[level][first:first + columns * rows]
+        size = self.CELL
+        for cell, shade in enumerate(shades):
+            y, x = divmod(cell, columns)
+            self.create_rectangle(x * size, y * size, x * size + size - 1, y * size + size - 1
+                , fill=HEAT_PALETTE[shade], width=0)
+
+class MinimapView(tkinter.Canvas):
+    # A strip beside ASMView of its whole source, one row per cell of the ListingSummary level that fits,
+    # code bytes in the function colour then data bytes, unmapped left dark. Dragging scrolls the view.
+    CODE = "#808080"
+    DATA = "#A08040"
+
+    def __init__(self, parent, view, **kwargs):
+        tkinter.Canvas.__init__(self, parent, **kwargs)
+        self.view = view
+        self.summary = None
+        self.bind("<Configure>", lambda e: self.redraw())
+        self.bind("<Button-1>", self.drag)
+        self.bind("<B1-Motion>", self.drag)
+        self.view.bind("<Expose>", lambda e: self.mark(), add="+")
+
+    def invalidate(self):
+        self.summary = None
+
+    def current(self):
+        return self.summary is not None and self.summary.code_map is self.view.listing()
+
+    def ensure(self):
+        if not self.current():
+            tic = time.time()
+            self.summary = ListingSummary(self.view.cursor, self.view.listing())
+            toc = time.time()
+            if toc - tic > 0.2:
+                print("JDB minimap", self.summary.pages(), "{:.3f}".format(toc - tic))
+        return self.summary
+
+    def scale(self):
+        # (level, pages per cell, pixels per cell)
+        summary = self.ensure()
+        height = max(self.winfo_height(), 1)
+        level = summary.fit(height)
+        return (level, 1 << level, float(height) / max(len(summary.levels[level][0]), 1))
+
+    def redraw(self):
+        if not self.winfo_ismapped() or not self.view.first:
+            return
+        self.delete(tkinter.ALL)
+        level, pages, pixels = self.scale()
+        width = self.winfo_width()
+        size = pages * ListingSummary.PAGE
+        for cell, (code, data, color) in enumerate(self.summary.cells(level)):
+            top, bottom = int(cell * pixels), int((cell + 1) * pixels)
+            x = width * min(code, size) // size
+            if code:
+                self.create_rectangle(0, top, x, bottom, fill=PALETTE[color] if color >= 0 else self.CODE, width=0)
+            if data:
+                self.create_rectangle(x, top, min(width, x + width * data // size), bottom, fill=self.DATA, width=0)
+        self.mark()
+
+    def mark(self):
+        # outline of the lines on screen
+        if not self.winfo_ismapped() or not self.view.first or not self.view.items:
+            return
+        if not self.current():
+            # the source or its listing changed under the strip
+            self.redraw()
+            return
+        self.delete("view")
+        level, pages, pixels = self.scale()
+        map = self.view.first["map"]
+        top = self.summary.page_of(map, self.view.first["address"]) // pages * pixels
+        bottom = (self.summary.page_of(map, self.view.items[-1].address) // pages + 1) * pixels
+        self.create_rectangle(0, int(top), self.winfo_width() - 1, int(bottom), outline="white", tags=("view",))
+
+    def drag(self, event):
+        if not self.view.first:
+            return
+        level, pages, pixels = self.scale()
+        page = min(max(int(event.y / pixels), 0) * pages, self.summary.pages() - 1)
+        first = self.view.locate(*self.summary.address_of(page))
+        if first is not None:
+            self.view.setfirst(first)
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# persistent render caches, one SQLite file per database, empty to disable
+CACHE_DIR = os.environ.get("ANNOTATE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "annotate"))
+
+def split_sql(text):
+    # statements end at a semicolon at the end of a line, as in schema.sql and migrations
+    statement = []
+    for line in text.splitlines():
+        if not statement and (not line.strip() or line.startswith("--")):
+            continue
+        statement.append(line)
+        if line.rstrip().endswith(";"):
+            yield "\n".join(statement).rstrip()[:-1]
+            statement = []
+    if "".join(statement).strip():
+        yield "\n".join(statement)
+
 class DB(object):
-    def __init__(self):
+    def __init__(self, **kwargs):
         self.database = None
         self.cursor = None
+        self.last = None      # cursor of the last execute, fetches read from it
+        self.prepared = {}    # name:cursor of each Statement prepared on this connection
+        self.stats = collections.defaultdict(lambda: [0, 0.0, 0.0]) # name:[runs, seconds, slowest]
+        self.connect_args = {"host":"localhost", "database":"ct", "user":"root", "password":"1234"}
+        self.connect_args.update(kwargs)
         self.reconnect()
 
     def __iter__(self):
-        return self.cursor.__iter__()
+        return self.last.__iter__()
 
     def __next__(self):
-        return self.cursor__next__()
+        return self.last.__next__()
 
     def reconnect(self):
+        for cursor in self.prepared.values():
+            cursor.close()
+        self.prepared.clear()
+
         if self.cursor:
             self.cursor.close()
 
         if self.database:
             self.database.close()
 
-        self.database = mariadb.connect(host="localhost", database="ct", user="root", password="1234")
+        if mariadb is None:
+            raise ImportError("the mariadb connector is needed to open a database, --snapshot works without it")
+        self.database = mariadb.connect(**self.connect_args)
         self.cursor = self.database.cursor(dictionary=True)
+        self.last = self.cursor
 
     def execute(self, sql, params=None):
         try:
-            self.cursor.execute(sql, params)
+            self.run(sql, params)
         except mariadb.OperationalError as e:
-            if e[0] == 2055:
+            if e.errno == 2055: # lost connection
                 self.reconnect()
-                self.cursor.execute(sql, params)
+                self.run(sql, params)
             else:
                 raise
 
+    def run(self, sql, params):
+        if not isinstance(sql, Statement):
+            self.last = self.cursor
+            self.cursor.execute(sql, params)
+            return
+
+        cursor = self.prepared.get(sql.name)
+        if cursor is None:
+            cursor = self.prepared[sql.name] = self.database.cursor(dictionary=True, prepared=True, buffered=True)
+        self.last = cursor
+        tic = time.time()
+        cursor.execute(sql.sql, params if params is not None else ())
+        seconds = time.time() - tic
+        stats = self.stats[sql.name]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    def report(self):
+        # one line per statement run on this connection, most total time first
+        lines = []
+        for name, (runs, seconds, slowest) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            lines.append("{:<20} {:>8} runs {:>9.3f}s total {:>8.3f}ms mean {:>8.3f}ms max".format(
+                name, runs, seconds, seconds * 1000 / runs, slowest * 1000))
+        return lines
+
+    def fetchall(self, *args, **kwargs):
+        return self.last.fetchall(*args, **kwargs)
+
+    def fetchone(self, *args, **kwargs):
+        return self.last.fetchone(*args, **kwargs)
+
+    def commit(self):
+        self.database.commit()
+
+    def schema_version(self):
+        self.execute("CREATE TABLE IF NOT EXISTS schema_version"
+                     " ( version int(10) unsigned NOT NULL"
+                     " , name char(255) NOT NULL"
+                     " , applied timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP"
+                     " , PRIMARY KEY (version)"
+                     " ) ENGINE=InnoDB DEFAULT CHARSET=utf8")
+        self.execute("SELECT IFNULL(MAX(version), 0) AS version FROM schema_version")
+        return self.fetchone()['version']
+
+    def pending_migrations(self, directory=MIGRATIONS):
+        current = self.schema_version()
+        pending = []
+        for filename in sorted(os.listdir(directory)):
+            version, _, name = filename.partition("_")
+            if filename.endswith(".sql") and version.isdigit() and int(version) > current:
+                pending.append((int(version), name[:-len(".sql")], os.path.join(directory, filename)))
+        return pending
+
+    def migrate(self, directory=MIGRATIONS):
+        # MyISAM DDL is not transactional, so each migration is recorded as soon as it has run
+        applied = []
+        for version, name, path in self.pending_migrations(directory):
+            with open(path) as f:
+                for statement in split_sql(f.read()):
+                    self.execute(statement)
+            self.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            self.commit()
+            applied.append((version, name))
+        return applied
+
+# tables a snapshot holds as (columns, key), columns are (name, array typecode or "s" for text, nullable)
+# and rows are stored in order of the first key columns
+SNAPSHOT_TABLES = collections.OrderedDict((
+      ("bytes", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                , ("byte", "B", False), ("type", "b", True)), 4))
+    , ("codemap", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                  , ("m", "B", False), ("x", "B", False)), 6))
+    , ("functions", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("begin", "I", False)
+                    , ("end", "I", False), ("name", "s", False), ("context", "B", False)), 4))
+    , ("calls", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                , ("fsmap", "B", False), ("fsaddress", "I", False), ("fmap", "B", False), ("faddress", "I", False)), 4))
+    , ("datamap", ((("dmap", "B", False), ("daddress", "I", False), ("csmap", "B", False), ("csaddress", "I", False)
+                  , ("cmap", "B", False), ("caddress", "I", False), ("readdata", "B", False)), 7))
+    , ("comments", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                   , ("context", "B", False), ("comment", "s", True), ("length", "I", True)), 5))
+    , ("variables", ((("id", "I", False), ("name", "s", False)), 1))
+    , ("accesses", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                   , ("variable", "I", False)), 4))
+    , ("structs", ((("id", "I", False), ("name", "s", False), ("layout", "s", False)), 1))
+    , ("struct_ranges", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("address", "I", False)
+                        , ("struct", "I", False), ("count", "I", False)), 4))
+    , ("fingerprints", ((("smap", "B", False), ("saddress", "I", False), ("map", "B", False), ("begin", "I", False)
+                       , ("instructions", "I", False), ("hash", "s", False), ("signature", "s", False)), 4))
+    , ("fingerprint_bands", ((("band", "B", False), ("bucket", "I", False), ("smap", "B", False), ("saddress", "I", False)
+                            , ("map", "B", False), ("begin", "I", False)), 6))
+    ))
+
+class Snapshot(object):
+    # A whole project in one file: magic, header length, a JSON header, then every column as an 8 byte
+    # aligned native endian array. A text column is the end offset of each row into its own UTF-8 heap and
+    # a nullable column carries a byte per row that is 1 for NULL. Columns are mapped, never read in.
+    MAGIC = b"CTSNAP1\n"
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("{} is not a snapshot".format(path))
+        length, = struct.unpack_from("<Q", self.map, len(self.MAGIC))
+        self.header = json.loads(self.map[16:16 + length].decode("utf-8"))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError("{} was written on a {} endian machine".format(path, self.header["byteorder"]))
+        self.base = self.align(16 + length)
+        self.view = memoryview(self.map)
+        # (smap, saddress, map):(first row, end row) of the tables ordered by source
+        self.ranges = {table:{tuple(r[:3]):(r[3], r[4]) for r in ranges} for table, ranges in self.header["ranges"].items()}
+        self.images = {}
+
+    @staticmethod
+    def align(offset):
+        return (offset + 7) & ~7
+
+    def array(self, extent, typecode):
+        offset, size = extent
+        return self.view[self.base + offset:self.base + offset + size].cast(typecode)
+
+    def rows(self, table):
+        return self.header["tables"][table]["rows"]
+
+    def column(self, table, name):
+        # a text column comes back as its end offsets
+        typecode, extent, nulls, heap = self.header["tables"][table]["columns"][name]
+        return self.array(extent, "I" if typecode == "s" else typecode)
+
+    def values(self, table, name):
+        # the column as python values, text decoded and NULLs as None
+        typecode, extent, nulls, heap = self.header["tables"][table]["columns"][name]
+        column = self.column(table, name)
+        if typecode == "s":
+            heap = self.array(heap, "B")
+            values = [bytes(heap[begin:end]).decode("utf-8") for begin, end in zip(itertools.chain((0,), column), column)]
+        else:
+            values = column.tolist()
+        if nulls:
+            values = [None if null else value for value, null in zip(values, self.array(nulls, "B"))]
+        return values
+
+    def table(self, table):
+        columns, key = SNAPSHOT_TABLES[table]
+        return zip(*(self.values(table, name) for name, typecode, nullable in columns))
+
+    def range(self, table, smap, saddress, map):
+        return self.ranges[table].get((smap, saddress, map), (0, 0))
+
+    def image(self, smap, saddress, map):
+        # (first address, bytes) of a source's map, zero filled between known bytes. Contiguous bytes
+        # are the mapped column itself, only sources with gaps are copied.
+        key = (smap, saddress, map)
+        if key not in self.images:
+            lo, hi = self.range("bytes", smap, saddress, map)
+            addresses = self.column("bytes", "address")[lo:hi]
+            data = self.column("bytes", "byte")[lo:hi]
+            if lo == hi:
+                self.images[key] = (0, memoryview(b""))
+            elif addresses[-1] - addresses[0] == hi - lo - 1:
+                self.images[key] = (addresses[0], data)
+            else:
+                image = bytearray(addresses[-1] - addresses[0] + 1)
+                for address, byte in zip(addresses, data):
+                    image[address - addresses[0]] = byte
+                self.images[key] = (addresses[0], memoryview(image))
+        return self.images[key]
+
+    @classmethod
+    def write(cls, path, db, batch=65536):
+        # snapshots every SNAPSHOT_TABLES table of db
+        header = {"byteorder":sys.byteorder, "tables":{}, "ranges":{}}
+        arrays = [] # (offset, bytes)
+        offset = 0
+
+        def place(data):
+            nonlocal offset
+            arrays.append((offset, data))
+            extent = [offset, len(data)]
+            offset = cls.align(offset + len(data))
+            return extent
+
+        cursor = db.database.cursor()
+        for table, (columns, key) in SNAPSHOT_TABLES.items():
+            names = [name for name, typecode, nullable in columns]
+            values = [array.array("I" if typecode == "s" else typecode) for name, typecode, nullable in columns]
+            nulls = [bytearray() if nullable else None for name, typecode, nullable in columns]
+            heaps = [bytearray() if typecode == "s" else None for name, typecode, nullable in columns]
+            # explain: skip
+            cursor.execute("SELECT {} FROM {} ORDER BY {}".format(", ".join("`{}`".format(name) for name in names), table
+                , ", ".join("`{}`".format(name) for name in names[:key])))
+            ranges = collections.OrderedDict()
+            rows = 0
+            while True:
+                fetched = cursor.fetchmany(batch)
+                if not fetched:
+                    break
+                for row in fetched:
+                    for i, (name, typecode, nullable) in enumerate(columns):
+                        value = row[i]
+                        if nullable:
+                            nulls[i].append(value is None)
+                        if typecode == "s":
+                            heaps[i] += (value or "").encode("utf-8")
+                            values[i].append(len(heaps[i]))
+                        else:
+                            values[i].append(value or 0)
+                    if names[:3] == ["smap", "saddress", "map"]:
+                        first, end = ranges.get(row[:3], (rows, rows))
+                        ranges[row[:3]] = (first, rows + 1)
+                    rows += 1
+
+            header["tables"][table] = {"rows":rows, "columns":{name:[typecode, place(values[i].tobytes())
+                , place(bytes(nulls[i])) if nulls[i] is not None and any(nulls[i]) else None
+                , place(bytes(heaps[i])) if heaps[i] is not None else None]
+                for i, (name, typecode, nullable) in enumerate(columns)}}
+            if ranges:
+                header["ranges"][table] = [list(source) + list(extent) for source, extent in ranges.items()]
+        cursor.close()
+
+        # explain: bulk
+        db.execute("SELECT smap, saddress, map, type, size, begin, end FROM sources WHERE size > 0")
+        header["sources"] = [[row[k] for k in ("smap", "saddress", "map", "type", "size", "begin", "end")] for row in db.fetchall()]
+        db.execute("SELECT version FROM data_version WHERE id = 1")
+        header["data_version"] = db.fetchone()['version']
+
+        encoded = json.dumps(header).encode("utf-8")
+        base = cls.align(16 + len(encoded))
+        with open(path, "wb") as f:
+            f.write(cls.MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for at, data in arrays:
+                f.seek(base + at)
+                f.write(data)
+            f.truncate(base + offset)
+
+    def restore(self, db, batch=10000):
+        # inserts every table into db, rows already there are kept
+        for table, (columns, key) in SNAPSHOT_TABLES.items():
+            insert = "INSERT IGNORE INTO {} ({}) VALUES ({})".format(table
+                , ", ".join("`{}`".format(name) for name, typecode, nullable in columns), ", ".join("?" * len(columns)))
+            rows = self.table(table)
+            while True:
+                chunk = list(itertools.islice(rows, batch))
+                if not chunk:
+                    break
+                db.cursor.executemany(insert, chunk)
+            db.commit()
+            yield (table, self.rows(table))
+
+class SnapshotDB(object):
+    # A read-only stand-in for DB over a snapshot. ByteStore, CodeMap and AccessStore read bytes, codemap
+    # and datamap straight from the mapped columns, the smaller tables go into an in-memory SQLite
+    # database the views' queries run against unchanged.
+    MEMORY = ("functions", "calls", "comments", "variables", "accesses", "structs", "struct_ranges"
+            , "fingerprints", "fingerprint_bands")
+    schema = ("CREATE TABLE sources (smap, saddress, map, type, size, begin, end, PRIMARY KEY (smap, saddress, map))"
+            , "CREATE TABLE data_version (id PRIMARY KEY, version)"
+            , "CREATE TABLE changelog (id INTEGER PRIMARY KEY, version, kind, smap, saddress, map, address, context)"
+            , "CREATE INDEX functions_range ON functions (smap, saddress, map, end, begin)"
+            , "CREATE INDEX map_address ON comments (map, address)"
+            , "CREATE INDEX fingerprints_hash ON fingerprints (hash)")
+
+    def __init__(self, path):
+        tic = time.time()
+        self.snapshot = Snapshot(path)
+        self.connect_args = {"database":"snapshot-" + os.path.splitext(os.path.basename(path))[0]}
+        self.database = sqlite3.connect(":memory:")
+        self.cursor = self.database.cursor()
+        self.cursor.row_factory = lambda cursor, row: {column[0]:value for column, value in zip(cursor.description, row)}
+
+        for table in self.MEMORY:
+            columns, key = SNAPSHOT_TABLES[table]
+            names = [name for name, typecode, nullable in columns]
+            self.database.execute("CREATE TABLE {} ({}, PRIMARY KEY ({}))".format(table, ", ".join(names), ", ".join(names[:key])))
+            self.database.executemany("INSERT INTO {} VALUES ({})".format(table, ", ".join("?" * len(names))), self.snapshot.table(table))
+        for statement in self.schema:
+            self.database.execute(statement)
+        self.database.executemany("INSERT INTO sources VALUES (?, ?, ?, ?, ?, ?, ?)", self.snapshot.header["sources"])
+        self.database.execute("INSERT INTO data_version VALUES (1, ?)", (self.snapshot.header["data_version"],))
+        self.database.commit()
+        self.database.execute("PRAGMA query_only = ON")
+        toc = time.time()
+        if toc - tic > 0.5:
+            print("JDB snapshot open", path, "{:.3f}".format(toc - tic))
+
+    def __iter__(self):
+        return self.cursor.__iter__()
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(str(sql), params or ())
+
     def fetchall(self, *args, **kwargs):
         return self.cursor.fetchall(*args, **kwargs)
 
@@ -1085,6 +2096,1442 @@ class DB(object):
     def commit(self):
         self.database.commit()
 
+    def pending_migrations(self, directory=MIGRATIONS):
+        return []
+
+    def report(self):
+        return []
+
+class WriteBehind(object):
+    # Coalesces comment and function edits and commits them in batches on a
+    # background connection. Results are handed back to the Tk thread by polling.
+    comment_insert = ("INSERT INTO comments"
+                      "       (smap, saddress, map, address, context, comment, length)"
+                      "VALUES (?, ?, ?, ?, ?, ?, NULL)"
+                      "    ON DUPLICATE KEY UPDATE"
+                      "       comment = VALUES(comment)")
+    comment_delete = ("DELETE FROM comments"
+                      " WHERE smap = ?"
+                      "   AND saddress = ?"
+                      "   AND map = ?"
+                      "   AND address = ?"
+                      "   AND context = ?")
+    function_update = ("UPDATE functions"
+                       "   SET name = ?"
+                       " WHERE smap = ?"
+                       "   AND saddress = ?"
+                       "   AND map = ?"
+                       "   AND begin = ?")
+    # data_version, changelog and comments are InnoDB and roll back with a failed batch, functions is
+    # MyISAM and doesn't. Renames therefore run after the comments, but a batch failing at the changelog
+    # still leaves its renames applied without a changelog row, other instances only see them on reload.
+    version_update = ("UPDATE data_version"
+                      "   SET version = LAST_INSERT_ID(version + 1)"
+                      " WHERE id = 1")
+    version_query = "SELECT LAST_INSERT_ID() AS version"
+    changelog_insert = ("INSERT INTO changelog"
+                        "       (version, kind, smap, saddress, map, address, context)"
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    # other instances that fall this far behind see a gap in versions and drop their caches
+    changelog_prune = ("DELETE FROM changelog"
+                       " WHERE id < LAST_INSERT_ID() - 100000")
+
+    def __init__(self, widget, callback, delay=250, **connect_args):
+        self.widget = widget
+        self.callback = callback # callback(keys, error, version) on the Tk thread after each batch
+        self.delay = delay
+        self.connect_args = connect_args
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict() # key:(statement, params), the last edit of a key wins
+        self.results = queue.Queue()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.timer = None
+        self.backoff = 1000 # ms before retrying a failed batch, doubled on each failure
+        self.thread = threading.Thread(target=self.run, name="WriteBehind", daemon=True)
+        self.thread.start()
+        self.poll()
+
+    def comment(self, smap, saddress, map, address, context, comment):
+        key = ("Comment", smap, saddress, map, address, context)
+        if comment:
+            self.put(key, self.comment_insert, (smap, saddress, map, address, context, comment))
+        else:
+            self.put(key, self.comment_delete, (smap, saddress, map, address, context))
+
+    def function(self, smap, saddress, map, begin, name):
+        self.put(("Function", smap, saddress, map, begin), self.function_update, (name, smap, saddress, map, begin))
+
+    def put(self, key, statement, params):
+        with self.lock:
+            self.pending.pop(key, None)
+            self.pending[key] = (statement, params)
+
+        # debounce, a burst of edits becomes one transaction
+        if self.timer:
+            self.widget.after_cancel(self.timer)
+        self.timer = self.widget.after(self.delay, self.flush)
+
+    def flush(self):
+        self.timer = None
+        self.wake.set()
+
+    def run(self):
+        db = None
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+
+            with self.lock:
+                batch = self.pending
+                self.pending = collections.OrderedDict()
+                stopping = self.stopping
+
+            if batch:
+                try:
+                    if db is None:
+                        db = DB(**self.connect_args)
+                    db.execute(self.version_update)
+                    db.execute(self.version_query)
+                    version = db.fetchone()['version']
+                    for statement, params in sorted(batch.values(), key=lambda write: write[0] is self.function_update):
+                        db.execute(statement, params)
+                    db.cursor.executemany(self.changelog_insert, [(version,) + key + (None,) * (7 - len(key)) for key in batch])
+                    db.execute(self.changelog_prune)
+                    db.commit()
+                    self.results.put((list(batch), None, version))
+                except Exception as e:
+                    try:
+                        db.database.rollback()
+                    except Exception:
+                        db = None
+                    # keep the failed writes unless they were edited again meanwhile
+                    with self.lock:
+                        for key, value in batch.items():
+                            self.pending.setdefault(key, value)
+                    self.results.put((list(batch), e, None))
+
+            if stopping:
+                return
+
+    def poll(self):
+        while True:
+            try:
+                keys, error, version = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.callback(keys, error, version)
+            # failed writes went back into pending, retry them even without another edit
+            if error is None:
+                self.backoff = 1000
+            elif not self.stopping and not self.timer:
+                self.timer = self.widget.after(self.backoff, self.flush)
+                self.backoff = min(self.backoff * 2, 60000)
+        if not self.stopping:
+            self.widget.after(100, self.poll)
+
+    def close(self):
+        # flush everything that is pending and wait for it, returns the writes that still failed
+        if self.timer:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+        with self.lock:
+            self.stopping = True
+        self.wake.set()
+        self.thread.join()
+        self.poll()
+        return list(self.pending)
+
+class ChangeFeed(object):
+    # Follows the changelog every Annotate instance writes with its annotation batches,
+    # polled by id on the Tk thread and handed on one data_version at a time.
+    start_query = ("SELECT (SELECT version FROM data_version WHERE id = 1) AS version"
+                   "     , (SELECT IFNULL(MAX(id), 0) FROM changelog) AS id")
+    changes_query = Statement("changelog changes"
+                            , "SELECT id, version, kind, smap, saddress, map, address, context"
+                              "  FROM changelog"
+                              " WHERE id > ?"
+                              " ORDER BY id")
+
+    def __init__(self, widget, cursor, callback, interval=2000):
+        self.widget = widget
+        self.cursor = cursor
+        self.callback = callback # callback(version, keys) with keys None when changes were missed
+        self.interval = interval
+        self.cursor.execute(self.start_query)
+        row = self.cursor.fetchone()
+        self.version = row['version']
+        self.id = row['id']
+        self.timer = self.widget.after(self.interval, self.poll)
+
+    @staticmethod
+    def key(row):
+        if row['kind'] == "Comment":
+            return ("Comment", row['smap'], row['saddress'], row['map'], row['address'], row['context'])
+        return (row['kind'], row['smap'], row['saddress'], row['map'], row['address'])
+
+    def poll(self):
+        self.cursor.execute(self.changes_query, (self.id,))
+        rows = self.cursor.fetchall()
+        # end the read view, otherwise the next poll can't see newer commits
+        self.cursor.commit()
+
+        for version, group in itertools.groupby(rows, key=lambda row: row['version']):
+            group = list(group)
+            keys = [self.key(row) for row in group]
+            if version != self.version + 1:
+                keys = None
+            self.version = version
+            self.id = group[-1]['id']
+            self.callback(version, keys)
+
+        if self.timer:
+            self.timer = self.widget.after(self.interval, self.poll)
+
+    def close(self):
+        if self.timer:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+        self.poll()
+
+class SourceCatalogue(object):
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.maps = {} # (smap, saddress):{map:(type, size, begin, end)}
+        self.reload()
+
+    def reload(self):
+        # explain: bulk
+        source_query = ("SELECT smap, saddress, map, type, size, begin, end"
+                        "  FROM sources"
+                        " WHERE size > 0")
+        self.cursor.execute(source_query)
+        self.maps.clear()
+        for row in self.cursor:
+            self.maps.setdefault((row['smap'], row['saddress']), {})[row['map']] = (
+                row['type'], row['size'], row['begin'], row['end'])
+
+    def type(self, smap, saddress):
+        types = [t for (t, size, begin, end) in self.maps.get((smap, saddress), {}).values() if t is not None]
+        return min(types) if types else None
+
+    def sources(self, type):
+        # like "WHERE type = ?", no source has type None
+        if type is None:
+            return []
+        return sorted(source for source in self.maps if self.type(*source) == type)
+
+    def first(self, type):
+        sources = self.sources(type)
+        return sources[0] if sources else (None, None)
+
+    def range(self, smap, saddress, map):
+        type, size, begin, end = self.maps.get((smap, saddress), {}).get(map, (None, 0, 0, -1))
+        return (begin, end)
+
+class CodeMap(object):
+    # The listing of one source, instruction starts from codemap and data blocks from comments,
+    # held as sorted arrays per map. Each instruction start is stored once with its m/x kept as
+    # maximal runs of constant state; addresses decoded under several states keep them all in multi.
+    def __init__(self, cursor, smap, saddress):
+        self.cursor = cursor
+        self.source = (smap, saddress)
+        self.code = {}       # map:array("I") of instruction addresses
+        self.run_starts = {} # map:array("I") index into code where a run of constant m/x starts
+        self.run_states = {} # map:bytearray of m << 1 | x for each run
+        self.multi = {}      # (map, address):((m, x), ...) every state of a multi-state address
+        self.blocks = {}     # map:array("I") of data block addresses
+        self.lengths = {}    # map:array("I") of data block lengths
+        self.load()
+
+    def rows(self):
+        # (map, address, m, x) in order, from the mapped columns of a snapshot
+        snapshot = getattr(self.cursor, "snapshot", None)
+        if snapshot:
+            ranges = sorted((extent, source[2]) for source, extent in snapshot.ranges.get("codemap", {}).items()
+                if source[:2] == self.source)
+            if not ranges:
+                return ()
+            lo, hi = ranges[0][0][0], ranges[-1][0][1]
+            return zip(*(snapshot.column("codemap", name)[lo:hi] for name in ("map", "address", "m", "x")))
+
+        # explain: bulk
+        code_query = ("SELECT map, address, m, x"
+                      "  FROM codemap"
+                      " WHERE smap = ?"
+                      "   AND saddress = ?"
+                      " ORDER BY map, address, m, x")
+        self.cursor.execute(code_query, self.source)
+        return [(row['map'], row['address'], row['m'], row['x']) for row in self.cursor.fetchall()]
+
+    def load(self):
+        code = run_starts = run_states = None
+        before = None # state of the instruction before the current one
+        for map, address, m, x in self.rows():
+            state = m << 1 | x
+            if map not in self.code:
+                code = self.code[map] = array.array("I")
+                run_starts = self.run_starts[map] = array.array("I")
+                run_states = self.run_states[map] = bytearray()
+                before = None
+            if code and code[-1] == address:
+                states = self.multi.setdefault((map, address), [run_states[-1]])
+                states.append(state)
+                # prefer the state the code flows in with, so the run carries on through the address
+                if state == before and run_states[-1] != state and run_starts[-1] == len(code) - 1:
+                    run_starts.pop()
+                    run_states.pop()
+                continue
+            before = run_states[-1] if run_states else None
+            code.append(address)
+            if not run_states or run_states[-1] != state:
+                run_starts.append(len(code) - 1)
+                run_states.append(state)
+        self.multi = {key:tuple((s >> 1, s & 1) for s in states) for key, states in self.multi.items()}
+
+        # explain: bulk
+        block_query = ("SELECT map, address, length"
+                       "  FROM comments"
+                       " WHERE length IS NOT NULL"
+                       "   AND smap = ?"
+                       "   AND saddress = ?"
+                       " ORDER BY map, address")
+        self.cursor.execute(block_query, self.source)
+        for row in self.cursor.fetchall():
+            if row['map'] not in self.blocks:
+                self.blocks[row['map']] = array.array("I")
+                self.lengths[row['map']] = array.array("I")
+            self.blocks[row['map']].append(row['address'])
+            self.lengths[row['map']].append(row['length'])
+
+    def maps(self):
+        return sorted(set(self.code) | set(self.blocks))
+
+    def count(self, map):
+        return len(self.code.get(map, ())) + len(self.blocks.get(map, ()))
+
+    def state(self, map, i):
+        # (m, x) of the i-th instruction of a map
+        state = self.run_states[map][bisect.bisect_right(self.run_starts[map], i) - 1]
+        return (state >> 1, state & 1)
+
+    def states(self, map, address, state):
+        return self.multi.get((map, address), (state,))
+
+    def ordinal(self, map, address):
+        # number of items of the map listed before address
+        return (bisect.bisect_left(self.code.get(map, ()), address)
+              + bisect.bisect_left(self.blocks.get(map, ()), address))
+
+    def contains(self, map, address):
+        for a in (self.code.get(map, ()), self.blocks.get(map, ())):
+            i = bisect.bisect_left(a, address)
+            if i < len(a) and a[i] == address:
+                return True
+        return False
+
+    def nth(self, map, k):
+        # address of the k-th item of a map, instructions come before blocks at the same address
+        code = self.code.get(map, ())
+        blocks = self.blocks.get(map, ())
+        lo, hi = max(0, k - len(blocks)), min(k, len(code))
+        while lo < hi:
+            i = (lo + hi) // 2
+            if code[i] <= blocks[k - i - 1]:
+                lo = i + 1
+            else:
+                hi = i
+        i, j = lo, k - lo
+        if j >= len(blocks) or (i < len(code) and code[i] <= blocks[j]):
+            return code[i]
+        return blocks[j]
+
+    def page(self, map, address, size):
+        # up to size rows from (map, address) on, continuing into the following maps
+        rows = []
+        for m in self.maps():
+            if m < map:
+                continue
+            start = address if m == map else 0
+            code = self.code.get(m, ())
+            blocks = self.blocks.get(m, ())
+            i = bisect.bisect_left(code, start)
+            j = bisect.bisect_left(blocks, start)
+            while len(rows) < size and (i < len(code) or j < len(blocks)):
+                if j >= len(blocks) or (i < len(code) and code[i] <= blocks[j]):
+                    state = self.state(m, i)
+                    rows.append({"asmtype":"code", "map":m, "address":code[i], "m":state[0], "x":state[1], "length":None
+                        , "states":self.states(m, code[i], state)})
+                    i += 1
+                else:
+                    rows.append({"asmtype":"data", "map":m, "address":blocks[j], "m":None, "x":None
+                        , "length":self.lengths[m][j], "states":()})
+                    j += 1
+            if len(rows) >= size:
+                break
+        return rows
+
+    def runs(self, map):
+        # (first address, last address, m, x) of each run of constant state, for tracing and export
+        code = self.code.get(map, ())
+        starts = list(self.run_starts.get(map, ())) + [len(code)]
+        for r, state in enumerate(self.run_states.get(map, ())):
+            yield (code[starts[r]], code[starts[r + 1] - 1], state >> 1, state & 1)
+
+class ListingSummary(object):
+    # A source's listing reduced to 256 byte pages, maps one after another: code and data bytes per
+    # page and the PALETTE index of the function covering most of it. Pages are then merged in pairs
+    # level by level so any height is drawn from the level that fits it.
+    PAGE = 0x100
+
+    def __init__(self, cursor, code_map):
+        self.code_map = code_map
+        self.spans = [] # (first page, map, first address) of each map
+        pages = 0
+        for map in code_map.maps():
+            code = code_map.code.get(map, ())
+            blocks = code_map.blocks.get(map, ())
+            first = min(a[0] for a in (code, blocks) if a) & ~(self.PAGE - 1)
+            last = max([code[-1] + 1 if code else 0] + [a + l for a, l in zip(blocks, code_map.lengths.get(map, ()))])
+            self.spans.append((pages, map, first))
+            pages += -(-(last - first) // self.PAGE)
+        self.span_starts = [span[0] for span in self.spans]
+
+        code_bytes = array.array("I", bytes(4 * pages))
+        data_bytes = array.array("I", bytes(4 * pages))
+        colors = array.array("h", [-1] * pages)
+        weights = array.array("I", bytes(4 * pages))
+        for base, map, first in self.spans:
+            # an instruction runs to the next one, at most 4 bytes
+            code = code_map.code.get(map, ())
+            for i, address in enumerate(code):
+                length = min(code[i + 1] - address, 4) if i + 1 < len(code) else 1
+                code_bytes[base + (address - first) // self.PAGE] += length
+            for address, length in zip(code_map.blocks.get(map, ()), code_map.lengths.get(map, ())):
+                for page, size in self.cover(first, address, address + length):
+                    data_bytes[base + page] += size
+
+        # explain: bulk
+        function_query = ("SELECT f.map, f.begin, f.end, CAST(f.row_num AS DOUBLE) / c.cnt AS color"
+                          "  FROM (SELECT *, ROW_NUMBER() OVER (ORDER BY begin) row_num FROM functions) f"
+                          "     , (SELECT COUNT(*) AS cnt FROM functions) c"
+                          " WHERE f.smap = ?"
+                          "   AND f.saddress = ?")
+        cursor.execute(function_query, code_map.source)
+        spans = {map:(base, first, end - base) for (base, map, first), end in zip(self.spans, self.span_starts[1:] + [pages])}
+        for row in cursor.fetchall():
+            if row['map'] not in spans:
+                continue
+            base, first, count = spans[row['map']]
+            for page, size in self.cover(first, max(row['begin'], first), min(row['end'] + 1, first + count * self.PAGE)):
+                if size > weights[base + page]:
+                    weights[base + page] = size
+                    colors[base + page] = color_index(float(row['color']) * 16)
+
+        self.levels = [(code_bytes, data_bytes, colors, weights)]
+        while len(self.levels[-1][0]) > 1:
+            code_bytes, data_bytes, colors, weights = self.levels[-1]
+            pairs = range(0, len(code_bytes) - 1, 2)
+            merged = (array.array("I", (code_bytes[i] + code_bytes[i + 1] for i in pairs))
+                    , array.array("I", (data_bytes[i] + data_bytes[i + 1] for i in pairs))
+                    , array.array("h", (colors[i + (weights[i + 1] > weights[i])] for i in pairs))
+                    , array.array("I", (max(weights[i], weights[i + 1]) for i in pairs)))
+            if len(code_bytes) % 2:
+                for column, values in zip(merged, self.levels[-1]):
+                    column.append(values[-1])
+            self.levels.append(merged)
+
+    def cover(self, first, begin, end):
+        # (page, bytes) of the pages begin up to end overlaps
+        while begin < end:
+            page = (begin - first) // self.PAGE
+            stop = min(end, first + (page + 1) * self.PAGE)
+            yield (page, stop - begin)
+            begin = stop
+
+    def fit(self, cells):
+        level = 0
+        while len(self.levels[level][0]) > cells:
+            level += 1
+        return level
+
+    def cells(self, level):
+        # (code bytes, data bytes, color) of each cell at level, in bytes of the cell
+        code_bytes, data_bytes, colors, weights = self.levels[level]
+        return zip(code_bytes, data_bytes, colors)
+
+    def page_of(self, map, address):
+        for base, m, first in self.spans:
+            if m == map:
+                return base + max(address - first, 0) // self.PAGE
+        return 0
+
+    def address_of(self, page):
+        # (map, address) where a page starts
+        base, map, first = self.spans[max(bisect.bisect_right(self.span_starts, page) - 1, 0)]
+        return (map, first + (page - base) * self.PAGE)
+
+    def pages(self):
+        return len(self.levels[0][0])
+
+class AccessStore(object):
+    # datamap as columns kept in two orders, by data address and by code address, so both
+    # directions are bisects. Keys are packed, data dmap << 24 | daddress and
+    # code csmap << 56 | csaddress << 32 | cmap << 24 | caddress, readdata is 1 for reads.
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.loaded = False
+        self.d_data = array.array("I") # data order
+        self.d_code = array.array("Q")
+        self.d_read = bytearray()
+        self.c_code = array.array("Q") # code order
+        self.c_data = array.array("I")
+        self.c_read = bytearray()
+        self.pyramids = {}
+
+    @staticmethod
+    def data_key(dmap, daddress):
+        return dmap << 24 | daddress
+
+    @staticmethod
+    def code_key(csmap, csaddress, cmap, caddress):
+        return csmap << 56 | csaddress << 32 | cmap << 24 | caddress
+
+    @staticmethod
+    def code_of(key):
+        return (key >> 56, key >> 32 & 0xFFFFFF, key >> 24 & 0xFF, key & 0xFFFFFF)
+
+    def invalidate(self):
+        self.loaded = False
+        self.pyramids.clear()
+
+    def ensure(self):
+        if not self.loaded:
+            self.load()
+
+    def load(self):
+        tic = time.time()
+        # explain: bulk
+        access_query = ("SELECT dmap, daddress, csmap, csaddress, cmap, caddress, readdata"
+                        "  FROM datamap"
+                        " ORDER BY dmap, daddress, csmap, csaddress, cmap, caddress, readdata")
+        data_key, code_key = self.data_key, self.code_key
+        snapshot = getattr(self.cursor, "snapshot", None)
+        if snapshot:
+            rows = zip(*(snapshot.column("datamap", name) for name in ("dmap", "daddress", "csmap", "csaddress", "cmap", "caddress", "readdata")))
+            self.build([(data_key(r[0], r[1]), code_key(r[2], r[3], r[4], r[5]), r[6]) for r in rows])
+        else:
+            # plain tuples, a dict per row costs more than the store itself
+            cursor = self.cursor.database.cursor()
+            cursor.execute(access_query)
+            self.build([(data_key(r[0], r[1]), code_key(r[2], r[3], r[4], r[5]), r[6]) for r in cursor.fetchall()])
+            cursor.close()
+        self.loaded = True
+        toc = time.time()
+        if toc - tic > 0.2:
+            print("JDB accesses", len(self.d_data), "{:.3f}".format(toc - tic))
+
+    def build(self, rows):
+        # rows are (data key, code key, readdata) in data order
+        self.pyramids.clear()
+        self.d_data = array.array("I", (r[0] for r in rows))
+        self.d_code = array.array("Q", (r[1] for r in rows))
+        self.d_read = bytearray(r[2] for r in rows)
+        if numpy is not None:
+            data = numpy.frombuffer(self.d_data, dtype=numpy.uint32)
+            code = numpy.frombuffer(self.d_code, dtype=numpy.uint64)
+            read = numpy.frombuffer(self.d_read, dtype=numpy.uint8)
+            order = numpy.lexsort((read, data, code))
+            self.c_code = array.array("Q", code[order].tobytes())
+            self.c_data = array.array("I", data[order].tobytes())
+            self.c_read = bytearray(read[order].tobytes())
+        else:
+            rows = sorted(zip(self.d_code, self.d_data, self.d_read))
+            self.c_code = array.array("Q", (r[0] for r in rows))
+            self.c_data = array.array("I", (r[1] for r in rows))
+            self.c_read = bytearray(r[2] for r in rows)
+
+    @staticmethod
+    def position(primary, secondary, reads, p, s, r):
+        # where (p, s, r) sorts in the columns and whether it is already there
+        i = bisect.bisect_left(primary, p)
+        hi = bisect.bisect_right(primary, p, i)
+        while i < hi and (secondary[i], reads[i]) < (s, r):
+            i += 1
+        return (i, i < hi and (secondary[i], reads[i]) == (s, r))
+
+    def append(self, rows):
+        # (dmap, daddress, csmap, csaddress, cmap, caddress, readdata) rows, as trace imports find them
+        self.ensure()
+        rows = [(self.data_key(r[0], r[1]), self.code_key(r[2], r[3], r[4], r[5]), r[6]) for r in rows]
+        if len(rows) > max(4096, len(self.d_data) // 16):
+            # merging a big batch one row at a time shifts the columns too often
+            self.build(sorted(set(zip(self.d_data, self.d_code, self.d_read)) | set(rows)))
+            return
+        for data, code, read in rows:
+            i, found = self.position(self.d_data, self.d_code, self.d_read, data, code, read)
+            if found:
+                continue
+            self.d_data.insert(i, data)
+            self.d_code.insert(i, code)
+            self.d_read.insert(i, read)
+            self.pyramids.pop(data >> 24, None)
+            i, found = self.position(self.c_code, self.c_data, self.c_read, code, data, read)
+            self.c_code.insert(i, code)
+            self.c_data.insert(i, data)
+            self.c_read.insert(i, read)
+
+    def add(self, rows):
+        # writes new datamap rows and appends them
+        access_insert = ("INSERT IGNORE INTO datamap"
+                         "       (dmap, daddress, csmap, csaddress, cmap, caddress, readdata)"
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)")
+        self.cursor.cursor.executemany(access_insert, rows)
+        self.cursor.commit()
+        if self.loaded:
+            self.append(rows)
+
+    def data_range(self, dmap, begin, end):
+        # (daddress, (csmap, csaddress, cmap, caddress), readdata) for begin <= daddress < end
+        self.ensure()
+        lo = bisect.bisect_left(self.d_data, self.data_key(dmap, begin))
+        hi = bisect.bisect_left(self.d_data, self.data_key(dmap, end), lo)
+        return [(self.d_data[i] & 0xFFFFFF, self.code_of(self.d_code[i]), self.d_read[i]) for i in range(lo, hi)]
+
+    def code_slice(self, csmap, csaddress, cmap, caddress):
+        self.ensure()
+        key = self.code_key(csmap, csaddress, cmap, caddress)
+        lo = bisect.bisect_left(self.c_code, key)
+        return (lo, bisect.bisect_right(self.c_code, key, lo))
+
+    def code_count(self, csmap, csaddress, cmap, caddress):
+        lo, hi = self.code_slice(csmap, csaddress, cmap, caddress)
+        return hi - lo
+
+    def code_range(self, csmap, csaddress, cmap, caddress, first=0, count=None):
+        # (dmap, daddress, readdata) accessed by one instruction, in data order
+        lo, hi = self.code_slice(csmap, csaddress, cmap, caddress)
+        lo = min(lo + first, hi)
+        if count is not None:
+            hi = min(hi, lo + count)
+        return [(self.c_data[i] >> 24, self.c_data[i] & 0xFFFFFF, self.c_read[i]) for i in range(lo, hi)]
+
+    def counts(self, dmap, daddress):
+        # (reads, writes) by distinct instructions
+        self.ensure()
+        key = self.data_key(dmap, daddress)
+        lo = bisect.bisect_left(self.d_data, key)
+        hi = bisect.bisect_right(self.d_data, key, lo)
+        reads = sum(self.d_read[lo:hi])
+        return (reads, hi - lo - reads)
+
+    def histogram(self, dmap, size):
+        # accesses per address of one data map, addresses past size are dropped
+        self.ensure()
+        lo = bisect.bisect_left(self.d_data, self.data_key(dmap, 0))
+        hi = bisect.bisect_left(self.d_data, self.data_key(dmap + 1, 0), lo)
+        if numpy is not None:
+            addresses = numpy.frombuffer(self.d_data, dtype=numpy.uint32)[lo:hi] & 0xFFFFFF
+            return numpy.bincount(addresses[addresses < size], minlength=size).astype(numpy.uint32)
+        counts = array.array("I", bytes(4 * size))
+        for i in range(lo, hi):
+            address = self.d_data[i] & 0xFFFFFF
+            if address < size:
+                counts[address] += 1
+        return counts
+
+    def pyramid(self, dmap, size):
+        if dmap not in self.pyramids:
+            tic = time.time()
+            self.pyramids[dmap] = HeatPyramid(self.histogram(dmap, size))
+            toc = time.time()
+            if toc - tic > 0.2:
+                print("JDB heat", dmap, "{:.3f}".format(toc - tic))
+        return self.pyramids[dmap]
+
+class HeatPyramid(object):
+    # access counts summed in pairs level by level, level 0 is per address and level n
+    # has one cell per 2**n addresses. shades holds each cell as a HEAT_PALETTE index,
+    # log scaled against the hottest cell of its level.
+    def __init__(self, counts):
+        self.levels = [counts]
+        while len(self.levels[-1]) > 1:
+            counts = self.levels[-1]
+            if numpy is not None:
+                counts = counts.reshape(-1, 2).sum(axis=1, dtype=numpy.uint32)
+            else:
+                counts = array.array("I", map(sum, zip(counts[0::2], counts[1::2])))
+            self.levels.append(counts)
+        self.shades = [self.shade(counts) for counts in self.levels]
+
+    @staticmethod
+    def shade(counts):
+        top = int(counts.max()) if numpy is not None else max(counts)
+        if not top:
+            return bytearray(len(counts))
+        if numpy is not None:
+            scaled = numpy.ceil(numpy.log1p(counts) / numpy.log1p(float(top)) * (HEATS - 1))
+            return bytearray(scaled.astype(numpy.uint8).tobytes())
+        scale = (HEATS - 1) / math.log1p(top)
+        return bytearray(int(math.ceil(math.log1p(count) * scale)) for count in counts)
+
+    def fit(self, cells):
+        # the most detailed level that fits in cells
+        level = 0
+        while len(self.levels[level]) > cells:
+            level += 1
+        return level
+
+class ByteStore(object):
+    # reads source bytes out of byte_chunks, keeping recently used chunks
+    CHUNK = 4096
+    chunk_query = Statement("byte chunks"
+                          , "SELECT chunk, data"
+                            "  FROM byte_chunks"
+                            " WHERE smap = ?"
+                            "   AND saddress = ?"
+                            "   AND map = ?"
+                            "   AND chunk >= ?"
+                            "   AND chunk <= ?")
+
+    def __init__(self, cursor, capacity=1024):
+        self.cursor = cursor
+        self.snapshot = getattr(cursor, "snapshot", None)
+        self.capacity = capacity
+        self.chunks = collections.OrderedDict() # (smap, saddress, map, chunk):bytes
+
+    def load(self, smap, saddress, map, first, last):
+        self.cursor.execute(self.chunk_query, (smap, saddress, map, first, last))
+        found = {row['chunk']:bytes(row['data']) for row in self.cursor.fetchall()}
+        for chunk in range(first, last + 1):
+            self.chunks[(smap, saddress, map, chunk)] = found.get(chunk, b"")
+        while len(self.chunks) > self.capacity:
+            self.chunks.popitem(last=False)
+
+    def chunk(self, smap, saddress, map, chunk):
+        key = (smap, saddress, map, chunk)
+        if key not in self.chunks:
+            self.load(smap, saddress, map, chunk, chunk)
+        self.chunks.move_to_end(key)
+        return self.chunks[key]
+
+    def read(self, smap, saddress, map, address, length):
+        # memoryview of length bytes from address, shorter past the end of the data
+        if self.snapshot:
+            begin, image = self.snapshot.image(smap, saddress, map)
+            if address >= begin:
+                return image[address - begin:address - begin + length]
+            return memoryview(bytes(min(begin - address, length)) + image[:max(address + length - begin, 0)])
+
+        first = address // self.CHUNK
+        last = (address + max(length, 1) - 1) // self.CHUNK
+        offset = address - first * self.CHUNK
+        if first == last:
+            return memoryview(self.chunk(smap, saddress, map, first))[offset:offset + length]
+
+        # fetch the missing chunks of the span in one query, then join them
+        missing = [c for c in range(first, last + 1) if (smap, saddress, map, c) not in self.chunks]
+        if missing:
+            self.load(smap, saddress, map, missing[0], missing[-1])
+        parts = [self.chunk(smap, saddress, map, c) for c in range(first, last + 1)]
+        data = b"".join(part.ljust(self.CHUNK, b"\0") for part in parts[:-1]) + parts[-1]
+        return memoryview(data)[offset:offset + length]
+
+    def source(self, smap, saddress):
+        # every byte of a source's first map from address 0, for views that decode a whole source
+        if self.snapshot:
+            maps = sorted(m for s, a, m in self.snapshot.ranges.get("bytes", {}) if (s, a) == (smap, saddress))
+            begin, image = self.snapshot.image(smap, saddress, maps[0]) if maps else (0, memoryview(b""))
+            return memoryview(bytes(begin) + image) if begin else image
+
+        source_query = ("SELECT map, chunk, data"
+                        "  FROM byte_chunks"
+                        " WHERE smap = ?"
+                        "   AND saddress = ?"
+                        " ORDER BY map, chunk")
+        self.cursor.execute(source_query, (smap, saddress))
+        rows = self.cursor.fetchall()
+        rows = [row for row in rows if row['map'] == rows[0]['map']]
+        data = bytearray()
+        for row in rows:
+            data += bytes(self.CHUNK * row['chunk'] - len(data))
+            data += row['data']
+        return memoryview(data)
+
+    def invalidate(self):
+        self.chunks.clear()
+
+class StructDef(object):
+    # a record layout, "name:type, ..." with types B W L D (1 to 4 byte unsigned),
+    # PW (word pointer into the record's bank) and PL (long pointer)
+    TYPES = {"B":("B", 1), "W":("H", 2), "L":("HB", 3), "D":("I", 4), "PW":("H", 2), "PL":("HB", 3)}
+
+    def __init__(self, id, name, layout):
+        self.id = id
+        self.name = name
+        self.fields = [] # (name, type)
+        fmt = "<"
+        for field in layout.split(","):
+            fname, _, ftype = (part.strip() for part in field.partition(":"))
+            if ftype not in self.TYPES:
+                raise ValueError("Unknown type {!r} for field {!r} of struct {}".format(ftype, fname, name))
+            self.fields.append((fname, ftype))
+            fmt += self.TYPES[ftype][0]
+
+        # 3 byte fields unpack as a word and a byte that are joined afterwards
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.slots = []
+        i = 0
+        for fname, ftype in self.fields:
+            self.slots.append((i, len(self.TYPES[ftype][0]) == 2))
+            i += len(self.TYPES[ftype][0])
+        self.joined = any(long for i, long in self.slots)
+        self.format = ", ".join("{}=${{:0{}X}}".format(fname, self.TYPES[ftype][1] * 2) for fname, ftype in self.fields)
+        self.pointers = [(i, ftype) for i, (fname, ftype) in enumerate(self.fields) if ftype in ("PW", "PL")]
+
+    def decode(self, data):
+        # one tuple of field values per whole record in data
+        records = self.struct.iter_unpack(data[:len(data) - len(data) % self.size])
+        if not self.joined:
+            return records
+        slots = self.slots
+        return (tuple(values[i] | values[i + 1] << 16 if long else values[i] for i, long in slots) for values in records)
+
+    def text(self, values):
+        return self.format.format(*values)
+
+    def jump_to(self, map, address, values):
+        # (map, address) of the record's first pointer, decoded as the call decoding does
+        for i, ftype in self.pointers:
+            if ftype == "PW":
+                return (map, (address & 0xFF0000) + values[i])
+            target = ADDRESS_SPACE.map(values[i])
+            if target[0] is not None:
+                return target
+        return None
+
+class StructRegistry(object):
+    # struct definitions and the data blocks they are applied to
+    def __init__(self, cursor, byte_store=None):
+        self.cursor = cursor
+        self.byte_store = byte_store or ByteStore(cursor)
+        self.structs = {} # id:StructDef
+        self.ranges = {}  # (smap, saddress, map, address):(StructDef, count)
+        self.reload()
+
+    def reload(self):
+        # explain: bulk
+        self.cursor.execute("SELECT id, name, layout FROM structs")
+        self.structs = {row['id']:StructDef(row['id'], row['name'], row['layout']) for row in self.cursor.fetchall()}
+
+        # explain: bulk
+        range_query = ("SELECT smap, saddress, map, address, struct, count"
+                       "  FROM struct_ranges")
+        self.cursor.execute(range_query)
+        self.ranges = {(row['smap'], row['saddress'], row['map'], row['address']):(self.structs[row['struct']], row['count'])
+            for row in self.cursor.fetchall() if row['struct'] in self.structs}
+
+    def at(self, smap, saddress, map, address):
+        return self.ranges.get((smap, saddress, map, address), (None, 0))[0]
+
+    def by_name(self, name):
+        for definition in self.structs.values():
+            if definition.name == name:
+                return definition
+        return None
+
+    def define(self, name, layout):
+        StructDef(None, name, layout)
+        define_query = ("INSERT INTO structs (name, layout)"
+                        "VALUES (?, ?)"
+                        "    ON DUPLICATE KEY UPDATE"
+                        "       layout = VALUES(layout)")
+        self.cursor.execute(define_query, (name, layout))
+        self.cursor.commit()
+        self.reload()
+
+    def apply(self, smap, saddress, map, address, name, count):
+        # the struct's data block is a comment whose length covers every record
+        definition = self.by_name(name)
+        if definition is None:
+            raise KeyError(name)
+        range_insert = ("INSERT INTO struct_ranges (smap, saddress, map, address, struct, count)"
+                        "VALUES (?, ?, ?, ?, ?, ?)"
+                        "    ON DUPLICATE KEY UPDATE"
+                        "       struct = VALUES(struct), count = VALUES(count)")
+        block_insert = ("INSERT INTO comments"
+                        "       (smap, saddress, map, address, context, comment, length)"
+                        "VALUES (?, ?, ?, ?, 0, ?, ?)"
+                        "    ON DUPLICATE KEY UPDATE"
+                        "       length = VALUES(length)")
+        self.cursor.execute(range_insert, (smap, saddress, map, address, definition.id, count))
+        self.cursor.execute(block_insert, (smap, saddress, map, address, definition.name, definition.size * count))
+        # let running instances redraw the block
+        self.cursor.execute(WriteBehind.version_update)
+        self.cursor.execute(WriteBehind.version_query)
+        version = self.cursor.fetchone()['version']
+        self.cursor.execute(WriteBehind.changelog_insert, (version, "Block", smap, saddress, map, address, None))
+        self.cursor.commit()
+        self.reload()
+
+    def records(self, smap, saddress, map, address, first=0, count=None):
+        # (record address, values) of the applied struct's records from first on
+        definition, total = self.ranges[(smap, saddress, map, address)]
+        count = total - first if count is None else min(count, total - first)
+        begin = address + first * definition.size
+        data = self.byte_store.read(smap, saddress, map, begin, max(count, 0) * definition.size)
+        return zip(range(begin, begin + len(data), definition.size), definition.decode(data))
+
+class SymbolTable(object):
+    # Names for operands, all in one dict: ("Site", smap, saddress, map, address) is the variable an
+    # instruction accesses, ("Code", smap, saddress, map, address) a function starting there and
+    # ("Data", map, address) a register named by its global comment.
+    ABSOLUTE = ("AB", "AIIX", "AIX", "AIY", "AI", "AIL")
+    LONG = ("AL", "ALIX")
+    RELATIVE = ("PCR", "PCRL")
+    LITERALS = ("I", "A", "IM", "IMM", "IMX", "BM") # no address to name
+    CALLS = (0x20, 0x4C, 0x22, 0x5C) # JSR JMP JSL JML
+    LITERAL = re.compile(r"\$[0-9A-F]+")
+    NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.loaded = False
+        self.symbols = {}
+
+    def invalidate(self):
+        self.loaded = False
+
+    def ensure(self):
+        if not self.loaded:
+            self.load()
+
+    def load(self):
+        tic = time.time()
+        self.symbols.clear()
+
+        # explain: bulk
+        variable_query = ("SELECT a.smap, a.saddress, a.map, a.address, v.name"
+                          "  FROM accesses a"
+                          "  JOIN variables v ON (v.id = a.variable)")
+        self.cursor.execute(variable_query)
+        for row in self.cursor.fetchall():
+            self.symbols[("Site", row['smap'], row['saddress'], row['map'], row['address'])] = row['name'].strip()
+
+        # explain: bulk
+        function_query = ("SELECT smap, saddress, map, begin, name"
+                          "  FROM functions")
+        self.cursor.execute(function_query)
+        for row in self.cursor.fetchall():
+            self.symbols[("Code", row['smap'], row['saddress'], row['map'], row['begin'])] = row['name']
+
+        # a register comment names it by its first word, "INIDISP - display control" is INIDISP
+        register_query = ("SELECT address, comment"
+                          "  FROM comments"
+                          " WHERE smap = 0"
+                          "   AND saddress = 0"
+                          "   AND map = 5"
+                          "   AND context = 0")
+        self.cursor.execute(register_query)
+        for row in self.cursor.fetchall():
+            name = self.NAME.match(row['comment'] or "")
+            if name:
+                self.symbols[("Data", 5, row['address'])] = name.group()
+
+        self.loaded = True
+        toc = time.time()
+        if toc - tic > 0.2:
+            print("JDB symbols", len(self.symbols), "{:.3f}".format(toc - tic))
+
+    def key(self, smap, saddress, map, pc, mode, code, text):
+        # the symbol an operand could name, None for modes without an address
+        if mode in self.ABSOLUTE:
+            value = code[2] << 8 | code[1]
+            if code[0] in self.CALLS:
+                return ("Code", smap, saddress, map, (pc & 0xFF0000) | value)
+            return ("Data",) + ADDRESS_SPACE.map(value)
+        if mode in self.LONG:
+            value = code[3] << 16 | code[2] << 8 | code[1]
+            if code[0] in self.CALLS:
+                # resolved like item_generate resolves a JSL, mirrors and HiROM banks land on the function
+                return ("Code", smap, saddress) + ADDRESS_SPACE.map(value)
+            return ("Data",) + ADDRESS_SPACE.map(value)
+        if mode in self.RELATIVE:
+            return ("Code", smap, saddress, map, (pc & 0xFF0000) | int(text[1:], 16))
+        return None
+
+    def operand(self, smap, saddress, map, pc, mode, code, text):
+        # text with its address literal replaced by a symbol when one is known
+        if mode.__name__ in self.LITERALS:
+            return text
+        self.ensure()
+        name = self.symbols.get(("Site", smap, saddress, map, pc))
+        if name is None:
+            name = self.symbols.get(self.key(smap, saddress, map, pc, mode.__name__, code, text))
+        # a function, so a name is never read as a replacement template
+        return self.LITERAL.sub(lambda literal: name, text, 1) if name else text
+
+class CallGraph(object):
+    # calls and functions as adjacency sets, a node is a function (smap, saddress, map, begin)
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.loaded = False
+        self.names = {}   # node:name
+        self.ranges = {}  # (smap, saddress, map):([begin], [end]) sorted by begin
+        self.callees = collections.defaultdict(set) # node:{node}
+        self.callers = collections.defaultdict(set) # node:{node}
+        self.sites = collections.defaultdict(list)  # node:[(smap, saddress, map, address)] of the calls to it
+
+    def invalidate(self):
+        self.loaded = False
+
+    def load(self):
+        self.names.clear()
+        self.ranges.clear()
+        self.callees.clear()
+        self.callers.clear()
+        self.sites.clear()
+
+        # explain: bulk
+        function_query = ("SELECT smap, saddress, map, begin, end, name"
+                          "  FROM functions"
+                          " ORDER BY smap, saddress, map, begin")
+        self.cursor.execute(function_query)
+        for row in self.cursor.fetchall():
+            source = (row['smap'], row['saddress'], row['map'])
+            begins, ends = self.ranges.setdefault(source, ([], []))
+            begins.append(row['begin'])
+            ends.append(row['end'])
+            self.names[source + (row['begin'],)] = row['name']
+
+        # explain: bulk
+        call_query = ("SELECT smap, saddress, map, address, fsmap, fsaddress, fmap, faddress"
+                      "  FROM calls")
+        self.cursor.execute(call_query)
+        for row in self.cursor.fetchall():
+            site = (row['smap'], row['saddress'], row['map'], row['address'])
+            callee = (row['fsmap'], row['fsaddress'], row['fmap'], row['faddress'])
+            self.sites[callee].append(site)
+            caller = self.containing(*site)
+            if caller:
+                self.callees[caller].add(callee)
+                self.callers[callee].add(caller)
+
+        for sites in self.sites.values():
+            sites.sort()
+        self.loaded = True
+
+    def ensure(self):
+        if not self.loaded:
+            self.load()
+
+    def function_at(self, smap, saddress, map, address):
+        self.ensure()
+        return self.containing(smap, saddress, map, address)
+
+    def containing(self, smap, saddress, map, address):
+        begins, ends = self.ranges.get((smap, saddress, map), ((), ()))
+        i = bisect.bisect_right(begins, address) - 1
+        if i >= 0 and ends[i] >= address:
+            return (smap, saddress, map, begins[i])
+        return None
+
+    def name(self, node):
+        return self.names.get(node, "{:06X}".format(node[3]))
+
+    def callers_of(self, node):
+        self.ensure()
+        return sorted(self.callers.get(node, ()))
+
+    def callees_of(self, node):
+        self.ensure()
+        return sorted(self.callees.get(node, ()))
+
+    def call_sites(self, node):
+        self.ensure()
+        return self.sites.get(node, [])
+
+    def reachable(self, node):
+        self.ensure()
+        seen = {node}
+        stack = [node]
+        while stack:
+            for callee in self.callees.get(stack.pop(), ()):
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.append(callee)
+        return seen
+
+    def components(self):
+        # strongly connected components with more than one function or a self call, iterative Tarjan
+        self.ensure()
+        index = {}
+        low = {}
+        stack = []
+        onstack = set()
+        components = []
+        for root in list(self.callees):
+            if root in index:
+                continue
+            work = [(root, iter(self.callees.get(root, ())))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            onstack.add(root)
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        onstack.add(child)
+                        work.append((child, iter(self.callees.get(child, ()))))
+                        break
+                    elif child in onstack:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            onstack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in self.callees.get(node, ()):
+                            components.append(sorted(component))
+        return components
+
+class FingerprintIndex(object):
+    # Functions as their normalised instructions: opcode and operand, with operands that move with the
+    # code (ROM addresses, jump targets, block move banks) masked so copies in other banks look the same.
+    # The whole sequence is hashed for exact copies, and a minhash of its instruction trigrams is cut
+    # into bands so near copies are found with one indexed lookup per band.
+    HASHES = 32
+    BAND = 2
+    SHINGLE = 3
+    PRIME = (1 << 61) - 1
+    OPERAND = {"I":0, "A":0, "DP":1, "DPIIX":1, "DPIX":1, "DPIY":1, "DPI":1, "DPIIY":1, "DPIL":1, "DPILIY":1
+             , "IM":1, "PCR":1, "SR":1, "SRIIY":1, "AB":2, "AIIX":2, "AIX":2, "AIY":2, "AI":2, "AIL":2
+             , "BM":2, "PCRL":2, "AL":3, "ALIX":3} # operand bytes by mode, IMM and IMX depend on m and x
+    JUMPS = (0x20, 0x4C, 0x6C, 0x7C, 0xDC, 0xFC) # JSR JMP JML, their operand is always code
+    function_query = Statement("fingerprint function"
+                             , "SELECT end, name"
+                               "  FROM functions"
+                               " WHERE smap = ?"
+                               "   AND saddress = ?"
+                               "   AND map = ?"
+                               "   AND begin = ?")
+    exact_query = Statement("fingerprint exact"
+                          , "SELECT smap, saddress, map, begin, signature"
+                            "  FROM fingerprints"
+                            " WHERE hash = ?"
+                            " LIMIT 500")
+    band_query = Statement("fingerprint band"
+                         , "SELECT f.smap, f.saddress, f.map, f.begin, f.signature"
+                           "  FROM fingerprint_bands b"
+                           "  JOIN fingerprints f ON (f.smap = b.smap AND f.saddress = b.saddress"
+                           "                      AND f.map = b.map AND f.begin = b.begin)"
+                           " WHERE b.band = ?"
+                           "   AND b.bucket = ?"
+                           " LIMIT 500")
+    signature_query = ("SELECT signature"
+                       "  FROM fingerprints"
+                       " WHERE smap = ?"
+                       "   AND saddress = ?"
+                       "   AND map = ?"
+                       "   AND begin = ?")
+    fingerprint_delete = ("DELETE FROM fingerprints"
+                          " WHERE smap = ?"
+                          "   AND saddress = ?"
+                          "   AND map = ?"
+                          "   AND begin = ?")
+    band_delete = ("DELETE FROM fingerprint_bands"
+                   " WHERE band = ?"
+                   "   AND bucket = ?"
+                   "   AND smap = ?"
+                   "   AND saddress = ?"
+                   "   AND map = ?"
+                   "   AND begin = ?")
+    fingerprint_insert = ("INSERT INTO fingerprints"
+                          "       (smap, saddress, map, begin, instructions, hash, signature)"
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    band_insert = ("INSERT INTO fingerprint_bands"
+                   "       (band, bucket, smap, saddress, map, begin)"
+                   "VALUES (?, ?, ?, ?, ?, ?)")
+
+    def __init__(self, cursor, byte_store):
+        self.cursor = cursor
+        self.byte_store = byte_store
+        self.code_maps = {} # (smap, saddress):CodeMap
+        rng = random.Random(0)
+        self.coefficients = [(rng.randrange(1, self.PRIME), rng.randrange(self.PRIME)) for i in range(self.HASHES)]
+
+    def invalidate(self):
+        self.code_maps.clear()
+
+    @classmethod
+    def normalise(cls, code, m, x):
+        mode = ASMView.decoder[code[0]][1].__name__
+        length = 2 - m if mode == "IMM" else 2 - x if mode == "IMX" else cls.OPERAND[mode]
+        operand = code[1:1 + length]
+        if mode in SymbolTable.ABSOLUTE or mode in SymbolTable.LONG:
+            if code[0] in cls.JUMPS or ADDRESS_SPACE.map(int.from_bytes(operand, "little"))[0] in (None, 1):
+                operand = b"*"
+        elif mode == "BM":
+            operand = b"*"
+        return code[:1] + operand
+
+    def instructions(self, smap, saddress, map, begin, end):
+        # [(address, normalised instruction)] of the instruction starts from begin to end
+        if (smap, saddress) not in self.code_maps:
+            self.code_maps[(smap, saddress)] = CodeMap(self.cursor, smap, saddress)
+        code_map = self.code_maps[(smap, saddress)]
+        code = code_map.code.get(map, ())
+        instructions = []
+        for i in range(bisect.bisect_left(code, begin), bisect.bisect_right(code, end)):
+            m, x = code_map.state(map, i)
+            data = bytes(self.byte_store.read(smap, saddress, map, code[i], 4)).ljust(4, b"\0")
+            instructions.append((code[i], self.normalise(data, m, x)))
+        return instructions
+
+    def fingerprint(self, instructions):
+        # (sha1 of the whole sequence, minhash signature of its trigrams)
+        tokens = [bytes([len(token)]) + token for address, token in instructions]
+        digest = hashlib.sha1(b"".join(tokens)).hexdigest()
+        shingles = {zlib.crc32(b"".join(tokens[i:i + self.SHINGLE])) for i in range(max(len(tokens) - self.SHINGLE + 1, 1))}
+        signature = [min((a * s + b) % self.PRIME for s in shingles) & 0xFFFFFFFF for a, b in self.coefficients]
+        return (digest, signature)
+
+    def buckets(self, signature):
+        return [zlib.crc32(struct.pack("<{}I".format(self.BAND), *signature[b:b + self.BAND]))
+            for b in range(0, self.HASHES, self.BAND)]
+
+    @staticmethod
+    def encode(signature):
+        return "".join("{:08x}".format(value) for value in signature)
+
+    @staticmethod
+    def decode(text):
+        return [int(text[i:i + 8], 16) for i in range(0, len(text), 8)]
+
+    def rebuild(self, batch=10000):
+        # replaces the index with every function as it is now, yields (source, functions) as each source is done
+        # explain: bulk
+        function_query = ("SELECT smap, saddress, map, begin, end"
+                          "  FROM functions"
+                          " ORDER BY smap, saddress, map, begin")
+        self.cursor.execute(function_query)
+        functions = self.cursor.fetchall()
+        self.cursor.execute("TRUNCATE TABLE fingerprints")
+        self.cursor.execute("TRUNCATE TABLE fingerprint_bands")
+        for source, rows in itertools.groupby(functions, lambda row: (row['smap'], row['saddress'])):
+            prints = []
+            bands = []
+            for row in rows:
+                node = (row['smap'], row['saddress'], row['map'], row['begin'])
+                instructions = self.instructions(*node, row['end'])
+                if not instructions:
+                    continue
+                digest, signature = self.fingerprint(instructions)
+                prints.append(node + (len(instructions), digest, self.encode(signature)))
+                bands += [(band, bucket) + node for band, bucket in enumerate(self.buckets(signature))]
+            for insert, values in ((self.fingerprint_insert, prints), (self.band_insert, bands)):
+                for i in range(0, len(values), batch):
+                    self.cursor.cursor.executemany(insert, values[i:i + batch])
+            self.cursor.commit()
+            self.code_maps.pop(source, None)
+            yield (source, len(prints))
+
+    def refresh(self, smap, saddress, map, begin):
+        # re-fingerprints one function as it is now, or drops it from the index once it's gone
+        node = (smap, saddress, map, begin)
+        self.cursor.execute(self.signature_query, node)
+        row = self.cursor.fetchone()
+        if row:
+            self.cursor.cursor.executemany(self.band_delete
+                , [(band, bucket) + node for band, bucket in enumerate(self.buckets(self.decode(row['signature'])))])
+            self.cursor.execute(self.fingerprint_delete, node)
+
+        self.cursor.execute(self.function_query, node)
+        row = self.cursor.fetchone()
+        instructions = self.instructions(*node, row['end']) if row else None
+        if instructions:
+            digest, signature = self.fingerprint(instructions)
+            self.cursor.execute(self.fingerprint_insert, node + (len(instructions), digest, self.encode(signature)))
+            self.cursor.cursor.executemany(self.band_insert
+                , [(band, bucket) + node for band, bucket in enumerate(self.buckets(signature))])
+        self.cursor.commit()
+
+    def similar(self, smap, saddress, map, begin, limit=100):
+        # [(node, estimated similarity, identical)] of the indexed functions like the given one, identical
+        # first. The function itself is fingerprinted as it is now, so it needn't be indexed.
+        tic = time.time()
+        self.cursor.execute(self.function_query, (smap, saddress, map, begin))
+        row = self.cursor.fetchone()
+        instructions = self.instructions(smap, saddress, map, begin, row['end']) if row else None
+        if not instructions:
+            return []
+        digest, signature = self.fingerprint(instructions)
+
+        found = {}
+        self.cursor.execute(self.exact_query, (digest,))
+        for row in self.cursor.fetchall():
+            found[(row['smap'], row['saddress'], row['map'], row['begin'])] = (1.0, True)
+        for band, bucket in enumerate(self.buckets(signature)):
+            self.cursor.execute(self.band_query, (band, bucket))
+            for row in self.cursor.fetchall():
+                node = (row['smap'], row['saddress'], row['map'], row['begin'])
+                if node not in found:
+                    same = sum(a == b for a, b in zip(signature, self.decode(row['signature'])))
+                    found[node] = (same / self.HASHES, False)
+        found.pop((smap, saddress, map, begin), None)
+
+        toc = time.time()
+        if toc - tic > 0.05:
+            print("JDB similar", len(found), "{:.3f}".format(toc - tic))
+        return heapq.nsmallest(limit, ((node,) + match for node, match in found.items())
+            , key=lambda match: (not match[2], -match[1], match[0]))
+
+    def transfer(self, source, target):
+        # (name, [(smap, saddress, map, address, context, comment)]) to copy from function source onto
+        # target, comments follow the instructions the two have in common and never replace the target's
+        comment_query = ("SELECT address, context, comment"
+                         "  FROM comments"
+                         " WHERE smap = ?"
+                         "   AND saddress = ?"
+                         "   AND map = ?"
+                         "   AND address >= ?"
+                         "   AND address <= ?"
+                         "   AND length IS NULL"
+                         "   AND comment IS NOT NULL")
+        # or (None, []) when either is gone, another instance may have deleted it since the index was built
+        ends = {}
+        comments = {}
+        for node in (source, target):
+            self.cursor.execute(self.function_query, node)
+            row = self.cursor.fetchone()
+            if not row:
+                self.refresh(*node)
+                return (None, [])
+            ends[node] = row['end']
+            if node == source:
+                name = row['name']
+            self.cursor.execute(comment_query, node + (row['end'],))
+            comments[node] = {(row['address'], row['context']):row['comment'] for row in self.cursor.fetchall()}
+
+        a = self.instructions(*source, ends[source])
+        b = self.instructions(*target, ends[target])
+        matcher = difflib.SequenceMatcher(None, [token for address, token in a], [token for address, token in b], autojunk=False)
+        addresses = {a[i + k][0]:b[j + k][0] for i, j, n in matcher.get_matching_blocks() for k in range(n)}
+
+        copied = []
+        for (address, context), comment in sorted(comments[source].items()):
+            if address in addresses and (addresses[address], context) not in comments[target]:
+                copied.append(target[:3] + (addresses[address], context, comment))
+        return (name, copied)
+
+class SearchIndex(object):
+    # trigram index over comments and function names, postings are doc ids in ascending order
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.loaded = False
+        self.keys = []  # doc:key, ("Comment", smap, saddress, map, address, context) or ("Function", smap, saddress, map, begin)
+        self.texts = [] # doc:text, None once replaced
+        self.lowered = [] # doc:lowercase text
+        self.docs = {}  # key:doc
+        self.trigrams = collections.defaultdict(lambda: array.array("I"))
+
+    @staticmethod
+    def trigrams_of(text):
+        return {text[i:i+3] for i in range(len(text) - 2)}
+
+    def load(self):
+        self.keys = []
+        self.texts = []
+        self.lowered = []
+        self.docs.clear()
+        self.trigrams.clear()
+
+        # explain: bulk
+        comment_query = ("SELECT smap, saddress, map, address, context, comment"
+                         "  FROM comments"
+                         " WHERE comment IS NOT NULL")
+        self.cursor.execute(comment_query)
+        for row in self.cursor.fetchall():
+            self.add(("Comment", row['smap'], row['saddress'], row['map'], row['address'], row['context']), row['comment'])
+
+        # explain: bulk
+        function_query = ("SELECT smap, saddress, map, begin, name"
+                          "  FROM functions")
+        self.cursor.execute(function_query)
+        for row in self.cursor.fetchall():
+            self.add(("Function", row['smap'], row['saddress'], row['map'], row['begin']), row['name'])
+
+        self.loaded = True
+
+    def add(self, key, text):
+        doc = len(self.keys)
+        lowered = text.lower()
+        self.keys.append(key)
+        self.texts.append(text)
+        self.lowered.append(lowered)
+        self.docs[key] = doc
+        for trigram in self.trigrams_of(lowered):
+            self.trigrams[trigram].append(doc)
+
+    def update(self, key, text):
+        if not self.loaded:
+            return
+        doc = self.docs.pop(key, None)
+        if doc is not None:
+            self.texts[doc] = None
+            self.lowered[doc] = None
+        if text:
+            self.add(key, text)
+
+    def rename_function(self, smap, saddress, map, begin, name):
+        self.update(("Function", smap, saddress, map, begin), name)
+
+    def search(self, query, limit=200):
+        if not self.loaded:
+            self.load()
+
+        # shorter queries have no trigram to look up
+        query = query.lower()
+        if len(query) < 3:
+            return []
+
+        postings = sorted((self.trigrams.get(t, ()) for t in self.trigrams_of(query)), key=len)
+        candidates = postings[0]
+        if len(postings) > 1 and len(candidates) > limit:
+            candidates = sorted(set(candidates).intersection(postings[1]))
+
+        # rank functions first, then exact matches, then matches at a word start, then shorter texts
+        hits = []
+        lowered = self.lowered
+        for doc in candidates:
+            text = lowered[doc]
+            if text is None:
+                continue
+            position = text.find(query)
+            if position < 0:
+                continue
+            rank = len(text)
+            if self.keys[doc][0] != "Function":
+                rank |= 1 << 42
+            if text != query:
+                rank |= 1 << 41
+            if position and text[position - 1].isalnum():
+                rank |= 1 << 40
+            hits.append((rank, doc))
+
+        return [(self.keys[doc], self.texts[doc]) for rank, doc in heapq.nsmallest(limit, hits)]
+
 class Annotate(tkinter.Tk):
     def publish(self, event):
         for widget in self.subscriptions[event]:
@@ -1095,12 +3542,52 @@ class Annotate(tkinter.Tk):
         self.subscriptions[event].add(widget)
         widget.bind("<<Publish"+event[2:], callback)
 
+    def startup_mark(self, phase):
+        now = time.time()
+        self.startup_times.append((phase, now - self.startup_last))
+        self.startup_last = now
+
+    def startup_report(self, view, elapsed):
+        if self.startup_times is not None:
+            self.startup_mark("first paint")
+            if sum(t for phase, t in self.startup_times) > 1.0:
+                print("JDB startup", ", ".join("{} {:.3f}".format(*t) for t in self.startup_times))
+            self.startup_times = None
+        if elapsed > 0.3:
+            print("JDB first show", view, "{:.3f}".format(elapsed))
+
     def __init__(self, **kwargs):
+        cache_dir = kwargs.pop("cache_dir", CACHE_DIR)
+        snapshot = kwargs.pop("snapshot", None)
+        self.startup_times = []
+        self.startup_last = time.time()
         tkinter.Tk.__init__(self, **kwargs)
         self.geometry("{}x{}+0+40".format(self.winfo_screenwidth()-15, self.winfo_screenheight()//2-40-15))
         #self.font = tkinter.font.Font(family="Consolas", size="14")
         self.font = tkinter.font.Font(family="Inconsolata", size="20")
-        self.cursor = DB()
+        # a snapshot opens read-only without a database server
+        self.cursor = SnapshotDB(snapshot) if snapshot else DB()
+        self.readonly = snapshot is not None
+        pending = self.cursor.pending_migrations()
+        if pending:
+            sys.exit("Database schema is out of date, run migrate.py to apply: {}".format(
+                ", ".join("{:04d}_{}".format(version, name) for version, name, path in pending)))
+        self.startup_mark("connect")
+        self.store = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.cursor.execute("SELECT version FROM data_version WHERE id = 1")
+            self.store = PersistentCache(os.path.join(cache_dir, self.cursor.connect_args["database"] + ".sqlite")
+                , self.cursor.fetchone()['version'])
+        self.sources = SourceCatalogue(self.cursor)
+        self.startup_mark("sources")
+        self.search = SearchIndex(self.cursor)
+        self.callgraph = CallGraph(self.cursor)
+        self.symbols = SymbolTable(self.cursor)
+        self.byte_store = ByteStore(self.cursor)
+        self.accesses = AccessStore(self.cursor)
+        self.structs = StructRegistry(self.cursor, self.byte_store)
+        self.fingerprints = FingerprintIndex(self.cursor, self.byte_store)
 
         self.subscriptions = collections.defaultdict(set) # event:{widgets}
 
@@ -1114,7 +3601,7 @@ class Annotate(tkinter.Tk):
         def updatecodenotebook(event):
             data = sourcelistbox.get(tkinter.ANCHOR).split(":", 1)
             if data[0]:
-                self.canvas.setsource(data[0], int(data[1], 16))
+                self.canvas.setsource(int(data[0]), int(data[1], 16))
         self.subscribe(codenotebook, "<<SourceChanged>>", updatecodenotebook)
 
         codenotebook.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
@@ -1126,7 +3613,8 @@ class Annotate(tkinter.Tk):
         asmxscroll.set(0.0, 1.0)
 
         asmcanvas = ASMView(asmframe, self.cursor, borderwidth=0, yscroll=asmyscroll
-            , xscroll = asmxscroll, highlightthickness=False, font=self.font)
+            , xscroll = asmxscroll, highlightthickness=False, font=self.font, cache_bytes=16*1024*1024, byte_store=self.byte_store
+            , accesses=self.accesses)
 
         self.canvas = asmcanvas
 
@@ -1138,6 +3626,9 @@ class Annotate(tkinter.Tk):
 
         asmcanvas.grid(row=0, column=0, sticky=tkinter.N+tkinter.S+tkinter.E+tkinter.W)
 
+        asmminimap = MinimapView(asmframe, asmcanvas, width=48, borderwidth=0, highlightthickness=False, background="black")
+        asmminimap.grid(row=0, column=2, sticky=tkinter.N+tkinter.S)
+
         asmframe.rowconfigure(0, weight=1)
         asmframe.columnconfigure(0, weight=1)
 
@@ -1150,7 +3641,8 @@ class Annotate(tkinter.Tk):
         scriptxscroll.set(0.0, 1.0)
 
         scriptcanvas = ScriptView(scriptframe, self.cursor, borderwidth=0, yscroll=scriptyscroll
-            , xscroll=scriptxscroll, highlightthickness=False, font=self.font)
+            , xscroll=scriptxscroll, highlightthickness=False, font=self.font, sources=self.sources
+            , byte_store=self.byte_store)
 
         scriptxscroll.config(command=scriptcanvas.xview)
         scriptxscroll.grid(row=1, column=0, sticky=tkinter.E+tkinter.W)
@@ -1172,7 +3664,8 @@ class Annotate(tkinter.Tk):
         wramxscroll.set(0.0, 1.0)
 
         wramcanvas = WRAMView(wramframe, self.cursor, borderwidth=0, yscroll=wramyscroll
-            , xscroll=wramxscroll, highlightthickness=False, font=self.font)
+            , xscroll=wramxscroll, highlightthickness=False, font=self.font, accesses=self.accesses
+            , callgraph=self.callgraph)
 
         wramxscroll.config(command=wramcanvas.xview)
         wramxscroll.grid(row=1, column=0, sticky=tkinter.E+tkinter.W)
@@ -1189,6 +3682,14 @@ class Annotate(tkinter.Tk):
 
         panedwindow.add(codenotebook)
 
+        self.history = History()
+        for view in (asmcanvas, scriptcanvas, wramcanvas):
+            view.history = self.history
+        for view in (asmcanvas, wramcanvas):
+            view.store = self.store
+        asmcanvas.structs = self.structs
+        asmcanvas.symbols = self.symbols
+
         # Data Notebook
         datanotebook = tkinter.ttk.Notebook(panedwindow)
         datanotebook.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
@@ -1215,7 +3716,7 @@ class Annotate(tkinter.Tk):
 
         iolistbox = DataView(iolistboxframe
             , self.cursor, borderwidth=0, yscroll=iolistboxyscroll, xscroll=iolistboxxscroll
-            , font=self.font, exportselection=False)
+            , font=self.font, exportselection=False, accesses=self.accesses)
         self.subscribe(iolistbox, "<<AddressChanged>>", lambda e: iolistbox.setaddress(1, int(self.canvas.io_address)))
         iolistbox.bind("<ButtonRelease-1>", lambda e: self.event_generate("<<UpdateIOEntry>>"))
         def updateiolist(event):
@@ -1250,10 +3751,12 @@ class Annotate(tkinter.Tk):
             , borderwidth=0, yscrollcommand=jumpscroll.set, font=self.font, exportselection=False)
         jumplistbox.bind("<Double-1>", lambda e: self.event_generate("<<Jump>>"))
 
+        jumps = [] # ViewState per jumplistbox line
+
         def jumplistbox_insert(event):
-            jumplistbox.insert(tkinter.END
-                , "{:06X} - {}".format(self.canvas.first["address"]
-                    , self.canvas.metadata[self.canvas.first["address"]].get("Function","None")))
+            state = self.history.back[-1]
+            jumps.append(state)
+            jumplistbox.insert(tkinter.END, state.label)
             jumplistbox.see(tkinter.END)
         self.subscribe(jumplistbox, "<<UpdateJumpList>>", jumplistbox_insert)
 
@@ -1275,14 +3778,9 @@ class Annotate(tkinter.Tk):
             try:
                 lookup = {"ASM":1, "Script":2, "WRAM":None} 
                 type = lookup[codenotebook.tab("current", "text")]
-                bytes_query = ("SELECT DISTINCT smap, saddress"
-                               "  FROM bytes"
-                               " WHERE type = ?"
-                               " ORDER BY saddress")
-                self.cursor.execute(bytes_query, (type,))
                 sourcelistbox.delete(0, tkinter.END)
-                for row in self.cursor:
-                    sourcelistbox.insert(tkinter.ANCHOR, "{}:{:06X}".format(*list(row.values())))
+                for source in self.sources.sources(type):
+                    sourcelistbox.insert(tkinter.ANCHOR, "{}:{:06X}".format(*source))
             except KeyError:
                 sourcelistbox.delete(0, tkinter.END)
         self.subscribe(sourcelistbox, "<<CodeNotebookTabChanged>>", updatesourcelistbox)
@@ -1295,8 +3793,208 @@ class Annotate(tkinter.Tk):
 
         datanotebook.add(sourceframe, text="Source")
 
+        # Search Frame
+        searchframe = tkinter.Frame(datanotebook, borderwidth=2, relief=tkinter.SUNKEN)
+        searchentry = tkinter.Entry(searchframe, font=self.font)
+        searchentry.pack(side=tkinter.TOP, fill=tkinter.X, expand=False)
+
+        searchlistboxframe = tkinter.Frame(searchframe)
+        searchscroll = tkinter.Scrollbar(searchlistboxframe)
+        searchlistbox = tkinter.Listbox(searchlistboxframe
+            , borderwidth=0, yscrollcommand=searchscroll.set, font=self.font, exportselection=False)
+        searchlistbox.bind("<Double-1>", lambda e: self.event_generate("<<SearchJump>>"))
+        searchhits = []
+
+        def updatesearchlistbox(event):
+            tic = time.time()
+            hits = self.search.search(searchentry.get())
+            toc = time.time()
+            if toc - tic > 0.05:
+                print("JDB search {}".format(toc - tic))
+
+            del searchhits[:]
+            searchlistbox.delete(0, tkinter.END)
+            for key, text in hits:
+                if key[0] == "Function":
+                    text = text + "()"
+                searchlistbox.insert(tkinter.END, "{}:{:06X} - {}".format(asmcanvas.map_name[key[3]], key[4], text))
+                searchhits.append(key)
+        searchentry.bind("<KeyRelease>", updatesearchlistbox)
+
+        searchlistbox.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+        searchscroll.config(command=searchlistbox.yview)
+        searchscroll.pack(side=tkinter.LEFT, fill=tkinter.Y)
+
+        searchlistboxframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=True)
+
+        datanotebook.add(searchframe, text="Search")
+
+        # Callers Frame
+        callersframe = tkinter.Frame(datanotebook, borderwidth=2, relief=tkinter.SUNKEN)
+        callersscroll = tkinter.Scrollbar(callersframe)
+        callerslistbox = tkinter.Listbox(callersframe
+            , borderwidth=0, yscrollcommand=callersscroll.set, font=self.font, exportselection=False)
+        callerslistbox.bind("<Double-1>", lambda e: self.event_generate("<<CallerJump>>"))
+        callersites = []
+
+        def updatecallerslistbox(event):
+            del callersites[:]
+            callerslistbox.delete(0, tkinter.END)
+            function = self.callgraph.function_at(asmcanvas.smap, asmcanvas.saddress, 1, int(asmcanvas.io_address))
+            if not function:
+                return
+            sites = self.callgraph.call_sites(function)
+            callerslistbox.insert(tkinter.END, "{}() - {} calls".format(self.callgraph.name(function), len(sites)))
+            callersites.append(None)
+            for site in sites:
+                caller = self.callgraph.function_at(*site)
+                callerslistbox.insert(tkinter.END, "{}:{:06X} - {}".format(asmcanvas.map_name[site[2]], site[3]
+                    , self.callgraph.name(caller) + "()" if caller else ""))
+                callersites.append(site)
+        self.subscribe(callerslistbox, "<<AddressChanged>>", updatecallerslistbox)
+
+        def jump_to_caller(event):
+            if not callerslistbox.curselection():
+                return
+            site = callersites[callerslistbox.curselection()[0]]
+            if site:
+                codenotebook.select(asmframe)
+                asmcanvas.setsource(site[0], site[1])
+                asmcanvas.jump(site[3], site[2])
+        self.bind("<<CallerJump>>", jump_to_caller)
+
+        callerslistbox.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+        callersscroll.config(command=callerslistbox.yview)
+        callersscroll.pack(side=tkinter.LEFT, fill=tkinter.Y)
+
+        datanotebook.add(callersframe, text="Callers")
+
+        # Similar Frame
+        similarframe = tkinter.Frame(datanotebook, borderwidth=2, relief=tkinter.SUNKEN)
+        similarcopy = tkinter.Button(similarframe, text="Copy name and comments to selected"
+            , command=lambda: self.event_generate("<<SimilarCopy>>"))
+        similarlistboxframe = tkinter.Frame(similarframe)
+        similarscroll = tkinter.Scrollbar(similarlistboxframe)
+        similarlistbox = tkinter.Listbox(similarlistboxframe
+            , borderwidth=0, yscrollcommand=similarscroll.set, font=self.font, exportselection=False)
+        similarlistbox.bind("<Double-1>", lambda e: self.event_generate("<<SimilarJump>>"))
+        similarnodes = []
+        similarfunction = [None] # the function listed, clicks within it don't look it up again
+
+        def updatesimilarlistbox(event):
+            function = self.callgraph.function_at(asmcanvas.smap, asmcanvas.saddress, 1, int(asmcanvas.io_address))
+            if function == similarfunction[0]:
+                return
+            similarfunction[0] = function
+            del similarnodes[:]
+            similarlistbox.delete(0, tkinter.END)
+            if not function:
+                return
+            matches = self.fingerprints.similar(*function)
+            similarlistbox.insert(tkinter.END, "{}() - {} similar".format(self.callgraph.name(function), len(matches)))
+            similarnodes.append(None)
+            for node, similarity, identical in matches:
+                similarlistbox.insert(tkinter.END, "{}:{:06X} - {}() {}".format(asmcanvas.map_name[node[2]], node[3]
+                    , self.callgraph.name(node), "identical" if identical else "{:.0%}".format(similarity)))
+                similarnodes.append(node)
+        self.subscribe(similarlistbox, "<<AddressChanged>>", updatesimilarlistbox)
+
+        def jump_to_similar(event):
+            if not similarlistbox.curselection():
+                return
+            node = similarnodes[similarlistbox.curselection()[0]]
+            if node:
+                codenotebook.select(asmframe)
+                asmcanvas.setsource(node[0], node[1])
+                asmcanvas.jump(node[3], node[2])
+        self.bind("<<SimilarJump>>", jump_to_similar)
+
+        def copy_to_similar(event):
+            if not similarlistbox.curselection() or not similarnodes[similarlistbox.curselection()[0]]:
+                return
+            if self.readonly:
+                InfoDialog("Info", "Snapshots are read-only, nothing was copied", parent=self)
+                return
+            source = similarfunction[0]
+            target = similarnodes[similarlistbox.curselection()[0]]
+            name, comments = self.fingerprints.transfer(source, target)
+            if name is None:
+                InfoDialog("Info", "The function no longer exists, nothing was copied", parent=self)
+                similarfunction[0] = None
+                updatesimilarlistbox(event)
+                return
+            commit_function(*target, name)
+            for comment in comments:
+                commit_comment(*comment)
+            InfoDialog("Info", "Named {:06X} {}() and copied {} comment(s)".format(target[3], name, len(comments)), parent=self)
+            similarfunction[0] = None
+            updatesimilarlistbox(event)
+        self.bind("<<SimilarCopy>>", copy_to_similar)
+
+        similarcopy.pack(side=tkinter.TOP, fill=tkinter.X, expand=False)
+        similarlistbox.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+        similarscroll.config(command=similarlistbox.yview)
+        similarscroll.pack(side=tkinter.LEFT, fill=tkinter.Y)
+
+        similarlistboxframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=True)
+
+        datanotebook.add(similarframe, text="Similar")
+
+        # Heatmap Frame
+        heatframe = tkinter.Frame(datanotebook, borderwidth=2, relief=tkinter.SUNKEN)
+        heatmaps = tkinter.Frame(heatframe)
+        heatmap = tkinter.IntVar(value=2)
+        heatlabel = tkinter.Label(heatframe, font=self.font, anchor=tkinter.W)
+        heatcanvas = HeatmapView(heatframe, self.accesses, borderwidth=0, highlightthickness=False, background="black")
+        for name in ("WRAM", "SRAM", "REG"):
+            tkinter.Radiobutton(heatmaps, text=name, variable=heatmap, value=asmcanvas.map_name[name]
+                , command=lambda: heatcanvas.setmap(heatmap.get())).pack(side=tkinter.LEFT)
+        heatcanvas.bind("<Map>", lambda e: heatcanvas.redraw())
+
+        def heat_text(event):
+            cell = heatcanvas.address_at(event.x, event.y)
+            if cell:
+                heatlabel.configure(text="{} {:06X}-{:06X} - {} accesses".format(asmcanvas.map_name[heatcanvas.dmap], *cell))
+        heatcanvas.bind("<Motion>", heat_text)
+
+        def jump_to_heat(event):
+            cell = heatcanvas.address_at(event.x, event.y)
+            if cell and heatcanvas.dmap == asmcanvas.map_name["WRAM"]:
+                codenotebook.select(wramframe)
+                wramcanvas.jump(cell[0])
+        heatcanvas.bind("<Button-1>", jump_to_heat)
+
+        heatmaps.pack(side=tkinter.TOP, fill=tkinter.X, expand=False)
+        heatlabel.pack(side=tkinter.TOP, fill=tkinter.X, expand=False)
+        heatcanvas.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=True)
+
+        datanotebook.add(heatframe, text="Heat")
+
+        def search_dialog(event):
+            datanotebook.select(searchframe)
+            searchentry.focus_set()
+            searchentry.select_range(0, tkinter.END)
+        self.bind("<Control-f>", search_dialog)
+
+        def jump_to_search(event):
+            if not searchlistbox.curselection():
+                return
+            key = searchhits[searchlistbox.curselection()[0]]
+            smap, saddress, map, address = key[1:5]
+            if smap == 0 and map == asmcanvas.map_name["WRAM"]:
+                codenotebook.select(wramframe)
+                wramcanvas.jump(address)
+            elif smap != 0:
+                codenotebook.select(asmframe)
+                asmcanvas.setsource(smap, saddress)
+                asmcanvas.jump(address, map)
+        self.bind("<<SearchJump>>", jump_to_search)
+
         def tabpreload(event):
-            # callbacks won't fire until tab is loaded
+            # callbacks won't fire until tab is loaded, views only query once they are first shown
             for tab_id in range(1, datanotebook.index("end")):
                 datanotebook.after(50*tab_id, datanotebook.select, tab_id)
             datanotebook.after(50*datanotebook.index("end"), datanotebook.select, 0)
@@ -1305,6 +4003,8 @@ class Annotate(tkinter.Tk):
 
         panedwindow.add(datanotebook)
 
+        self.startup_mark("widgets")
+
         def sashit(event):
             panedwindow.sash_place(0, int(panedwindow.winfo_width()*0.66), 0)
             panedwindow.unbind('<Map>')
@@ -1312,12 +4012,30 @@ class Annotate(tkinter.Tk):
 
         # root
 
+        def restore(state):
+            frames = {asmcanvas:asmframe, scriptcanvas:scriptframe, wramcanvas:wramframe}
+            codenotebook.select(frames[state.view])
+            self.canvas = state.view
+            state.view.restore(state)
+
         def jump_to_entry(event):
-            addr = int(jumplistbox.get(tkinter.ANCHOR).split(" - ", 1)[0], 16)
-            if addr is not None:
-                self.canvas.jump(addr)
+            if jumplistbox.curselection():
+                self.history.push(self.canvas.snapshot())
+                restore(jumps[jumplistbox.curselection()[0]])
         self.bind("<<Jump>>", jump_to_entry)
 
+        def go_back(event):
+            state = self.history.go_back(self.canvas.snapshot())
+            if state:
+                restore(state)
+        self.bind("<Alt-Left>", go_back)
+
+        def go_forward(event):
+            state = self.history.go_forward(self.canvas.snapshot())
+            if state:
+                restore(state)
+        self.bind("<Alt-Right>", go_forward)
+
         def jump_to_dialog(event):
             addr = askintegerliteral("Input", "Jump to addr:"
                 , parent=self, minvalue=0, maxvalue=self.canvas.max_address)
@@ -1351,10 +4069,18 @@ class Annotate(tkinter.Tk):
         self.bind_all("k", keyboard_scroll)
 
         def refresh(event):
-            self.canvas.cache.clear()
+            self.sources.reload()
+            self.structs.reload()
+            self.symbols.invalidate()
+            self.byte_store.invalidate()
+            self.accesses.invalidate()
+            self.fingerprints.invalidate()
+            self.canvas.invalidate()
             self.cursor.commit()
             self.canvas.update_geometry()
-            self.iolistbox.update_geometry()
+            iolistbox.update_geometry()
+            heatcanvas.redraw()
+            asmminimap.invalidate()
         self.bind("<F5>", refresh)
 
         def insertmode(event):
@@ -1366,39 +4092,112 @@ class Annotate(tkinter.Tk):
             self.bind_all("j", keyboard_scroll)
             self.bind_all("k", keyboard_scroll)
 
-        def commit_comment(smap, saddress, map, address, context, comment):
-            comment_insert = ("INSERT INTO comments"
-                              "       (smap, saddress, map, address, context, comment, length)"
-                              "VALUES (%(smap)s, %(saddress)s, %(map)s, %(address)s, %(context)s, %(comment)s, NULL)"
-                              "    ON DUPLICATE KEY UPDATE"
-                              "       comment = %(comment)s")
-            comment_delete = ("DELETE FROM comments"
+        def discard(keys):
+            # drops the cached lines keys touch, returns (whether anything visible changed, stale persistent keys)
+            visible = False
+            stale = []
+            for key in keys:
+                if key[0] == "Comment" and key[1] != 0:
+                    kind, smap, saddress, map, address, context = key
+                    if (smap, saddress) == (asmcanvas.smap, asmcanvas.saddress):
+                        asmcanvas.cache.discard((map, address))
+                        visible = visible or any(line.address == address for line in asmcanvas.items)
+                    if stale is not None:
+                        stale.append((("ASMView", smap, saddress), (map, address)))
+                else:
+                    # global comments and function names show up on many lines
+                    if key[0] == "Block":
+                        # data blocks are part of the listing itself, and struct ranges come with them
+                        asmcanvas.invalidate()
+                        self.structs.reload()
+                    self.symbols.invalidate()
+                    asmcanvas.cache.clear()
+                    wramcanvas.cache.clear()
+                    visible = True
+                    stale = None
+            return (visible, stale)
+
+        def written(keys, error, version):
+            if error:
+                print("JDB write failed", error, keys)
+                InfoDialog("Error", "Saving {} annotation(s) failed, will retry:\n{}".format(len(keys), error), parent=self)
+                return
+
+            # the views were rendered before the write landed
+            self.history.expire(jumps)
+            discard(keys)
+            self.written_versions.add(version)
+            self.canvas.update_geometry()
+            iolistbox.update_geometry()
+
+        def changed(version, keys):
+            own = version in self.written_versions
+            self.written_versions.discard(version)
+            if keys is None:
+                # fell behind the changelog, anything may have changed
+                keys = [("Block",)]
+                self.search.loaded = False
+                self.callgraph.invalidate()
+            elif not own:
+                # someone else's annotations, keep search and the call graph in step
+                for key in keys:
+                    if key[0] == "Comment":
+                        self.cursor.execute(comment_text_query, key[1:])
+                        row = self.cursor.fetchone()
+                        self.search.update(key, row['comment'] if row else None)
+                    elif key[0] == "Function":
+                        self.cursor.execute(function_name_query, key[1:])
+                        row = self.cursor.fetchone()
+                        self.search.update(key, row['name'] if row else None)
+                        self.callgraph.invalidate()
+
+            visible, stale = discard(keys)
+            if self.store is not None:
+                self.store.advance(version - 1, version, stale)
+            if not own:
+                self.history.expire(jumps)
+                if visible:
+                    self.canvas.update_geometry()
+                    iolistbox.update_geometry()
+        comment_text_query = ("SELECT comment"
+                              "  FROM comments"
                               " WHERE smap = ?"
                               "   AND saddress = ?"
                               "   AND map = ?"
                               "   AND address = ?"
                               "   AND context = ?")
-            if comment:
-                self.cursor.execute(comment_insert, {"smap":smap, "saddress":saddress, "map":map, "address":address, "context":context, "comment":comment})
-            else:
-                self.cursor.execute(comment_delete, (smap, saddress, map, address, context))
-            self.cursor.commit()
-            
-        def commit_function(map, address, comment):
-            function_update = ("UPDATE functions"
-                               "   SET name = ?"
-                               " WHERE map = ?"
+        function_name_query = ("SELECT name"
+                               "  FROM functions"
+                               " WHERE smap = ?"
+                               "   AND saddress = ?"
+                               "   AND map = ?"
                                "   AND begin = ?")
-            self.cursor.execute(function_update, (comment, map, address))
-            self.cursor.commit()
+        self.written_versions = set()
+        self.changes = ChangeFeed(self, self.cursor, changed)
+        self.writer = None if self.readonly else WriteBehind(self, written, **self.cursor.connect_args)
+
+        def commit_comment(smap, saddress, map, address, context, comment):
+            if self.readonly:
+                InfoDialog("Info", "Snapshots are read-only, the comment was not saved", parent=self)
+                return
+            self.writer.comment(smap, saddress, map, address, context, comment)
+            self.search.update(("Comment", smap, saddress, map, address, context), comment)
+
+        def commit_function(smap, saddress, map, address, comment):
+            if self.readonly:
+                InfoDialog("Info", "Snapshots are read-only, the name was not saved", parent=self)
+                return
+            self.writer.function(smap, saddress, map, address, comment)
+            self.search.rename_function(smap, saddress, map, address, comment)
+            self.callgraph.invalidate()
 
         def commit_entry(e):
             # TODO map = current view
             if self.canvas.entry_target == "Comment":
                 commit_comment(self.canvas.smap, self.canvas.saddress, 1, self.canvas.entry_address, 0, self.canvas.entry.get())
             else:
-                commit_function(1, self.canvas.entry_address, self.canvas.entry.get())
-            self.commandmode(e)
+                commit_function(self.canvas.smap, self.canvas.saddress, 1, self.canvas.entry_address, self.canvas.entry.get())
+            commandmode(e)
             self.canvas.event_generate("<<RemoveEntry>>")
         self.bind("<<CommitEntry>>", commit_entry)
 
@@ -1406,17 +4205,31 @@ class Annotate(tkinter.Tk):
             data = iolistbox.get(tkinter.ANCHOR).split(" - ", 1)
             map = self.canvas.map_name[data[0].split()[0]]
             address = int(data[0].split()[2], 16)
-            commit_comment(0, 0, map, address, self.canvas.metadata[iolistbox.caddress]["Context"], ioentry.get())
-            self.canvas.cache.clear()
-            self.canvas.update_geometry()
+            commit_comment(0, 0, map, address, self.canvas.metadata[iolistbox.caddress].context or 0, ioentry.get())
         self.bind("<<CommitIOEntry>>", commit_ioentry, add='+')
 
+        def close():
+            unsaved = self.writer.close() if self.writer else None
+            if unsaved:
+                print("JDB unsaved annotations", unsaved)
+            self.changes.close()
+            if self.store is not None:
+                self.store.close()
+            for line in self.cursor.report():
+                print("JDB", line)
+            self.destroy()
+        self.protocol("WM_DELETE_WINDOW", close)
+
         def setactivecanvas(event):
             lookup = {"ASM":asmcanvas, "Script":scriptcanvas, "WRAM":wramcanvas}
             self.canvas = lookup[codenotebook.tab("current", "text")]
         self.bind("<<CodeNotebookTabChanged>>", setactivecanvas, add='+')
 
 if __name__ == "__main__":
-    window = Annotate()
+    parser = argparse.ArgumentParser(description="Annotate SNES code and data.")
+    parser.add_argument("--snapshot", help="open a snapshot written by snapshot.py read-only instead of the database")
+    args = parser.parse_args()
+
+    window = Annotate(snapshot=args.snapshot)
     window.mainloop()
 
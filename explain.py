@@ -0,0 +1,142 @@
+import argparse
+import ast
+import os
+import random
+import re
+import sys
+
+import mariadb
+
+import annotate
+
+# Runs EXPLAIN on every query in annotate.py against a scratch database built from
+# schema.sql, the migrations and seeded rows, and flags full scans and filesorts.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Every key column is seeded with 1 so a parameter bound to 1 always finds rows,
+# otherwise the optimizer reports "Impossible WHERE" instead of a plan.
+PARAMS = {"page_size":50, "first_item":10, "length":3}
+
+# A query meant to read a whole table carries "# explain: bulk" on the line it starts on or the one
+# above, its scans and filesorts are expected and not flagged. "# explain: skip" marks queries that
+# don't run against MariaDB or are templates, they aren't explained at all.
+MARKER = re.compile(r"#\s*explain:\s*(bulk|skip)\b")
+
+def queries(path):
+    with open(path) as f:
+        text = f.read()
+    lines = text.splitlines()
+    tree = ast.parse(text, path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            sql = node.value.strip()
+            if re.match(r"(SELECT|WITH|UPDATE|DELETE)\b", sql, re.IGNORECASE):
+                marker = MARKER.search("\n".join(lines[max(node.lineno - 2, 0):node.lineno]))
+                yield node.lineno, sql, marker.group(1) if marker else None
+
+def bind(sql):
+    sql = re.sub(r"%\((\w+)\)s", lambda m: str(PARAMS.get(m.group(1), 1)), sql)
+    return sql.replace("?", "1")
+
+def seed(db, scale):
+    random.seed(0)
+    sources = range(1, 5)
+    size = 4096 * scale
+
+    rows = [(1, s, 1, a, random.randrange(256), (1, 2)[s % 2]) for s in sources for a in range(size)]
+    db.cursor.executemany("INSERT INTO bytes VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    rows = [(1, s, 1, a, a % 2, 0) for s in sources for a in range(0, size, 3)]
+    db.cursor.executemany("INSERT INTO codemap VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    rows = [(1, s, 1, a, a % 2, "comment {:06X}".format(a), (None, 8)[a % 7 == 0])
+        for s in sources for a in range(0, size, 9)]
+    rows += [(0, 0, 2, a, 1, "wram {:04X}".format(a), None) for a in range(0, 0x2000, 4)]
+    db.cursor.executemany("INSERT IGNORE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    rows = [(1, s, 1, a, a + 60, "function_{:06X}".format(a), a % 3) for s in sources for a in range(1, size, 64)]
+    db.cursor.executemany("INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    rows = [(1, s, 1, a, 1, s, 1, (a // 64) * 64 + 1) for s in sources for a in range(1, size, 12)]
+    db.cursor.executemany("INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    rows = [(d, random.randrange(1, 0x2000), 1, s, 1, a, a % 2) for d in (1, 2, 5)
+        for s in sources for a in range(1, size, 6)]
+    db.cursor.executemany("INSERT IGNORE INTO datamap VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    db.cursor.executemany("INSERT INTO variables VALUES (?, ?)", [(v, "var_{}".format(v)) for v in range(1, 100)])
+    rows = [(1, s, 1, a, a % 99 + 1) for s in sources for a in range(1, size, 30)]
+    db.cursor.executemany("INSERT INTO accesses VALUES (?, ?, ?, ?, ?)", rows)
+
+    # a handful of hashes and buckets so lookups find many functions, as short routines do
+    index = annotate.FingerprintIndex
+    rows = [(1, s, 1, a, 20, "{:x}".format(a % 7), "{:08x}".format(a % 31) * index.HASHES) for s in sources for a in range(1, size, 64)]
+    db.cursor.executemany("INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    rows = [(b, a % 13, 1, s, 1, a) for b in range(index.HASHES // index.BAND) for s in sources for a in range(1, size, 64)]
+    db.cursor.executemany("INSERT INTO fingerprint_bands VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    db.commit()
+    for table in ("bytes", "byte_chunks", "codemap", "comments", "functions", "calls", "datamap", "variables", "accesses"
+            , "fingerprints", "fingerprint_bands"):
+        db.execute("ANALYZE TABLE {}".format(table))
+        db.fetchall()
+
+def build(database, scale):
+    db = annotate.DB(database=None)
+    db.execute("DROP DATABASE IF EXISTS {}".format(database))
+    db.execute("CREATE DATABASE {}".format(database))
+    db = annotate.DB(database=database)
+
+    with open(os.path.join(HERE, "schema.sql")) as f:
+        for statement in annotate.split_sql(f.read()):
+            db.execute(statement)
+    db.commit()
+
+    db.migrate()
+    seed(db, scale)
+    return db
+
+def problems(plan):
+    for row in plan:
+        table = row['table'] or ""
+        extra = row['Extra'] or ""
+        if row['type'] in ("ALL", "index") and not table.startswith("<"):
+            yield "full {} scan of {}".format("table" if row['type'] == "ALL" else "index", table)
+        if "Using filesort" in extra:
+            yield "filesort on {}".format(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag full scans and filesorts in the queries of annotate.py.")
+    parser.add_argument("--database", default="ct_explain", help="scratch database, dropped and recreated")
+    parser.add_argument("--scale", type=int, default=4, help="4KB of seeded bytes per source per unit")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    db = build(args.database, args.scale)
+
+    flagged = 0
+    path = os.path.join(HERE, "annotate.py")
+    for lineno, sql, marker in queries(path):
+        if marker == "skip":
+            continue
+        try:
+            db.execute("EXPLAIN " + bind(sql))
+            plan = db.fetchall()
+        except mariadb.Error as e:
+            print("annotate.py:{} ERROR {}".format(lineno, e))
+            flagged += 1
+            continue
+
+        found = [] if marker == "bulk" else list(problems(plan))
+        if found or args.verbose:
+            print("annotate.py:{} {}".format(lineno, " ".join(sql.split())[:100]))
+            for row in plan:
+                print("    {id} {select_type:<12} {table!s:<12} {type!s:<8} {key!s:<20} {rows!s:>8} {Extra}".format(**row))
+            for problem in found:
+                print("    FLAG", problem)
+            print()
+        flagged += bool(found)
+
+    print("{} queries flagged".format(flagged))
+    sys.exit(1 if flagged else 0)
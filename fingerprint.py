@@ -0,0 +1,16 @@
+import argparse
+
+import annotate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint every function for finding duplicate and similar routines.")
+    parser.add_argument("--database", default="ct")
+    args = parser.parse_args()
+
+    db = annotate.DB(database=args.database)
+    index = annotate.FingerprintIndex(db, annotate.ByteStore(db))
+    total = 0
+    for (smap, saddress), functions in index.rebuild():
+        print("fingerprinted {}:{:06X} {}".format(smap, saddress, functions))
+        total += functions
+    print("{} functions".format(total))
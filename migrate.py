@@ -0,0 +1,18 @@
+import argparse
+
+import annotate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--database", default="ct")
+    parser.add_argument("--list", action="store_true", help="only list pending migrations")
+    args = parser.parse_args()
+
+    db = annotate.DB(database=args.database)
+    if args.list:
+        for version, name, path in db.pending_migrations():
+            print("{:04d}_{}".format(version, name))
+    else:
+        for version, name in db.migrate():
+            print("applied {:04d}_{}".format(version, name))
+        print("schema version", db.schema_version())
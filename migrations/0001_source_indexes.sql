@@ -0,0 +1,13 @@
+-- bytes is only ever read by source and location, (smap, saddress, map, address),
+-- never by a bare saddress or address.
+ALTER TABLE `bytes`
+  DROP KEY `bytes_saddress`,
+  DROP KEY `bytes_address`,
+  ADD KEY `bytes_source` (`smap`,`saddress`,`map`,`address`);
+
+-- functions are looked up by the range containing an address,
+-- smap = ? AND saddress = ? AND map = ? AND begin <= ? AND end >= ?
+ALTER TABLE `functions`
+  DROP KEY `functions_begin`,
+  DROP KEY `functions_end`,
+  ADD KEY `functions_range` (`smap`,`saddress`,`map`,`end`,`begin`);
@@ -0,0 +1,31 @@
+-- One row per source and map with the type, size and byte range of its bytes,
+-- so listing sources never scans bytes.
+CREATE TABLE `sources` (
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `type` tinyint(4) DEFAULT NULL,
+  `size` int(10) unsigned NOT NULL,
+  `begin` mediumint(8) unsigned NOT NULL,
+  `end` mediumint(8) unsigned NOT NULL,
+  PRIMARY KEY (`smap`,`saddress`,`map`),
+  KEY `sources_type` (`type`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+
+INSERT INTO `sources` (`smap`, `saddress`, `map`, `type`, `size`, `begin`, `end`)
+SELECT smap, saddress, map, MIN(type), COUNT(*), MIN(address), MAX(address)
+  FROM bytes
+ GROUP BY smap, saddress, map;
+
+-- Importers only insert into bytes, the catalogue follows along.
+-- Deleting bytes only shrinks size, begin and end are left as an upper bound.
+CREATE TRIGGER `bytes_sources_insert` AFTER INSERT ON `bytes` FOR EACH ROW
+  INSERT INTO `sources` (`smap`, `saddress`, `map`, `type`, `size`, `begin`, `end`)
+  VALUES (NEW.smap, NEW.saddress, NEW.map, NEW.type, 1, NEW.address, NEW.address)
+  ON DUPLICATE KEY UPDATE `size` = `size` + 1
+                        , `begin` = LEAST(`begin`, NEW.address)
+                        , `end` = GREATEST(`end`, NEW.address);
+
+CREATE TRIGGER `bytes_sources_delete` AFTER DELETE ON `bytes` FOR EACH ROW
+  UPDATE `sources` SET `size` = `size` - 1
+   WHERE `smap` = OLD.smap AND `saddress` = OLD.saddress AND `map` = OLD.map;
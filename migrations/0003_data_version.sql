@@ -0,0 +1,9 @@
+-- Bumped by every annotation batch so render caches kept outside the database
+-- can tell whether they are still current.
+CREATE TABLE `data_version` (
+  `id` tinyint(3) unsigned NOT NULL,
+  `version` int(10) unsigned NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+INSERT INTO `data_version` (`id`, `version`) VALUES (1, 0);
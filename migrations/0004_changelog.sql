@@ -0,0 +1,15 @@
+-- One row per annotation written, in commit order, so other Annotate instances
+-- can follow along by id and invalidate only what changed.
+-- Rows are written in the same transaction as the data_version bump, whose row lock
+-- serialises batches, so ids become visible in increasing order.
+CREATE TABLE `changelog` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `version` int(10) unsigned NOT NULL,
+  `kind` char(16) NOT NULL,
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `address` mediumint(8) unsigned NOT NULL,
+  `context` tinyint(3) unsigned DEFAULT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
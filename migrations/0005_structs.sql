@@ -0,0 +1,21 @@
+-- Record layouts, "name:type, ..." with types B W L D (1 to 4 byte unsigned),
+-- PW (word pointer into the record's bank) and PL (long pointer).
+CREATE TABLE `structs` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `name` char(255) NOT NULL,
+  `layout` text NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `structs_name` (`name`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+
+-- An array of count records starting at a data block, the block's comment length
+-- covers the whole array.
+CREATE TABLE `struct_ranges` (
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `address` mediumint(8) unsigned NOT NULL,
+  `struct` int(10) unsigned NOT NULL,
+  `count` mediumint(8) unsigned NOT NULL,
+  PRIMARY KEY (`smap`,`saddress`,`map`,`address`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
@@ -0,0 +1,33 @@
+-- The bytes of each source and map packed into 4KB chunks, chunk = address DIV 4096,
+-- addresses missing from bytes read back as zero. Readers use this instead of bytes.
+CREATE TABLE `byte_chunks` (
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `chunk` smallint(5) unsigned NOT NULL,
+  `data` blob NOT NULL,
+  PRIMARY KEY (`smap`,`saddress`,`map`,`chunk`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+
+SET SESSION group_concat_max_len = 16777216;
+
+-- each byte is prefixed with zeros for the addresses missing before it in its chunk
+INSERT INTO `byte_chunks` (`smap`, `saddress`, `map`, `chunk`, `data`)
+SELECT smap, saddress, map, chunk
+     , GROUP_CONCAT(CONCAT(REPEAT(CHAR(0), gap), CHAR(byte)) ORDER BY address SEPARATOR '')
+  FROM (SELECT smap, saddress, map, address, byte, address DIV 4096 AS chunk
+             , address - IFNULL(LAG(address) OVER (PARTITION BY smap, saddress, map, address DIV 4096 ORDER BY address)
+                              , (address DIV 4096) * 4096 - 1) - 1 AS gap
+          FROM bytes) b
+ GROUP BY smap, saddress, map, chunk;
+
+-- Importers still insert into bytes, the chunks follow along.
+CREATE TRIGGER `bytes_chunks_insert` AFTER INSERT ON `bytes` FOR EACH ROW
+  INSERT INTO `byte_chunks` (`smap`, `saddress`, `map`, `chunk`, `data`)
+  VALUES (NEW.smap, NEW.saddress, NEW.map, NEW.address DIV 4096, CONCAT(REPEAT(CHAR(0), NEW.address MOD 4096), CHAR(NEW.byte)))
+  ON DUPLICATE KEY UPDATE `data` = INSERT(RPAD(`data`, GREATEST(LENGTH(`data`), NEW.address MOD 4096 + 1), CHAR(0))
+                                        , NEW.address MOD 4096 + 1, 1, CHAR(NEW.byte));
+
+CREATE TRIGGER `bytes_chunks_delete` AFTER DELETE ON `bytes` FOR EACH ROW
+  UPDATE `byte_chunks` SET `data` = INSERT(`data`, OLD.address MOD 4096 + 1, 1, CHAR(0))
+   WHERE `smap` = OLD.smap AND `saddress` = OLD.saddress AND `map` = OLD.map AND `chunk` = OLD.address DIV 4096;
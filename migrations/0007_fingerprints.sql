@@ -0,0 +1,24 @@
+-- Function fingerprints, written by fingerprint.py: the sha1 of each function's normalised
+-- instructions and a minhash signature of their trigrams, both hex encoded.
+CREATE TABLE `fingerprints` (
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `begin` mediumint(8) unsigned NOT NULL,
+  `instructions` int(10) unsigned NOT NULL,
+  `hash` char(40) CHARACTER SET ascii NOT NULL,
+  `signature` varchar(256) CHARACTER SET ascii NOT NULL,
+  PRIMARY KEY (`smap`,`saddress`,`map`,`begin`),
+  KEY `fingerprints_hash` (`hash`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+
+-- The signature cut into bands, functions sharing a bucket in any band are candidates for similarity.
+CREATE TABLE `fingerprint_bands` (
+  `band` tinyint(3) unsigned NOT NULL,
+  `bucket` int(10) unsigned NOT NULL,
+  `smap` tinyint(3) unsigned NOT NULL,
+  `saddress` mediumint(8) unsigned NOT NULL,
+  `map` tinyint(3) unsigned NOT NULL,
+  `begin` mediumint(8) unsigned NOT NULL,
+  PRIMARY KEY (`band`,`bucket`,`smap`,`saddress`,`map`,`begin`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
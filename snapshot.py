@@ -0,0 +1,37 @@
+import argparse
+
+import annotate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a project to a snapshot file, or load one back into a database.")
+    parser.add_argument("--database", default="ct")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="snapshot every table of the database")
+    export.add_argument("path")
+
+    load = commands.add_parser("import", help="insert a snapshot's rows into a migrated database, existing rows are kept")
+    load.add_argument("path")
+
+    info = commands.add_parser("info", help="list the tables of a snapshot")
+    info.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        annotate.Snapshot.write(args.path, annotate.DB(database=args.database))
+        snapshot = annotate.Snapshot(args.path)
+        for table in annotate.SNAPSHOT_TABLES:
+            print("exported {} {}".format(table, snapshot.rows(table)))
+    elif args.command == "import":
+        db = annotate.DB(database=args.database)
+        for table, rows in annotate.Snapshot(args.path).restore(db):
+            print("imported {} {}".format(table, rows))
+        # the rows came from elsewhere, so every cache of this database is stale
+        db.execute(annotate.WriteBehind.version_update)
+        db.commit()
+    else:
+        snapshot = annotate.Snapshot(args.path)
+        print("data version", snapshot.header["data_version"])
+        for table in annotate.SNAPSHOT_TABLES:
+            print("{:<14} {:>10} rows".format(table, snapshot.rows(table)))
@@ -0,0 +1,53 @@
+import argparse
+import csv
+import sys
+
+import annotate
+
+def number(text):
+    return int(text, 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Declare record layouts, apply them to data blocks and export them.")
+    parser.add_argument("--database", default="ct")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    define = commands.add_parser("define", help="declare or redefine a struct")
+    define.add_argument("name")
+    define.add_argument("layout", help='"name:type, ..." with types B W L D PW PL')
+
+    commands.add_parser("list", help="list structs and where they are applied")
+
+    for command, help in (("apply", "apply a struct to count records starting at an address"), ("export", "write the records as CSV")):
+        sub = commands.add_parser(command, help=help)
+        sub.add_argument("smap", type=number)
+        sub.add_argument("saddress", type=number)
+        sub.add_argument("map", type=number)
+        sub.add_argument("address", type=number)
+        if command == "apply":
+            sub.add_argument("name")
+            sub.add_argument("count", type=number)
+        else:
+            sub.add_argument("--output", help="CSV file, default stdout")
+    args = parser.parse_args()
+
+    registry = annotate.StructRegistry(annotate.DB(database=args.database))
+    if args.command == "define":
+        registry.define(args.name, args.layout)
+    elif args.command == "list":
+        for definition in sorted(registry.structs.values(), key=lambda d: d.name):
+            print("{} ({} bytes): {}".format(definition.name, definition.size
+                , ", ".join("{}:{}".format(*field) for field in definition.fields)))
+        for (smap, saddress, map, address), (definition, count) in sorted(registry.ranges.items()):
+            print("{}:{:06X} {}:{:06X} {}[{}]".format(smap, saddress, map, address, definition.name, count))
+    elif args.command == "apply":
+        registry.apply(args.smap, args.saddress, args.map, args.address, args.name, args.count)
+    else:
+        definition = registry.at(args.smap, args.saddress, args.map, args.address)
+        if definition is None:
+            sys.exit("No struct applied at {}:{:06X}".format(args.map, args.address))
+        with (open(args.output, "w", newline="") if args.output else sys.stdout) as f:
+            writer = csv.writer(f)
+            writer.writerow(["address", "index"] + [fname for fname, ftype in definition.fields])
+            for index, (record, values) in enumerate(registry.records(args.smap, args.saddress, args.map, args.address)):
+                writer.writerow(["{:06X}".format(record), index] + list(values))
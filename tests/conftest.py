@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+
+import annotate
+
+class SourceDB(object):
+    # the parts of DB the loaders and Snapshot.write use, over sqlite
+    def __init__(self):
+        self.database = sqlite3.connect(":memory:")
+        self.cursor = self.database.cursor()
+        self.cursor.row_factory = lambda cursor, row: {column[0]:value for column, value in zip(cursor.description, row)}
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(str(sql), params or ())
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+@pytest.fixture
+def source_db():
+    # every snapshot table plus sources and data_version, empty
+    db = SourceDB()
+    for table, (columns, key) in annotate.SNAPSHOT_TABLES.items():
+        db.database.execute("CREATE TABLE {} ({})".format(table, ", ".join(name for name, typecode, nullable in columns)))
+    db.database.execute("CREATE TABLE sources (smap, saddress, map, type, size, begin, end)")
+    db.database.execute("CREATE TABLE data_version (id, version)")
+    db.database.execute("INSERT INTO data_version VALUES (1, 1)")
+    return db
@@ -0,0 +1,62 @@
+import pytest
+
+import annotate
+
+def deMMIO(address):
+    # the chain ASMView.deMMIO used before the rule table, kept as the reference
+    bank = address >> 16
+    page = address & 0xFFFF
+    # PPU
+    if   (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2100 <= page <= 0x213f): return (5, page)
+    # APU
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2140 <= page <= 0x217f): return (5, page)
+    # CPU
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x2180 <= page <= 0x2183): return (5, page)
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4016 <= page <= 0x4017): return (5, page)
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4200 <= page <= 0x421f): return (5, page)
+    # DMA
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x4300 <= page <= 0x437f): return (5, page)
+    # WRAM
+    elif (0x00 <= bank <= 0x3f or 0x80 <= bank <= 0xbf) and (0x0000 <= page <= 0x1fff): return (2, page)
+    elif (0x7e <= bank <= 0x7f) and (0x0000 <= page <= 0xffff): return (2, address - 0x7e0000)
+    # CART ROM
+    elif (0x00 <= bank <= 0x3f) and (0x8000 <= page <= 0xffff): return (1, address)
+    elif (0x80 <= bank <= 0xbf) and (0x8000 <= page <= 0xffff): return (1, address - 0x800000)
+    elif (0x40 <= bank <= 0x7d) and (0x0000 <= page <= 0xffff): return (1, address - 0x400000)
+    elif (0xc0 <= bank <= 0xff) and (0x0000 <= page <= 0xffff): return (1, address - 0xc00000)
+    # CART SRAM
+    elif (0x20 <= bank <= 0x3f or 0xa0 <= bank <= 0xbf) and (0x6000 <= page <= 0x7fff):
+        return (3, (address - 0x6000) & 0xffff)
+    return (None, None)
+
+# every rule's edges, one past them, and the pages around them
+EDGES = sorted({e for lo, hi in ((0x0000, 0x1fff), (0x2100, 0x213f), (0x2140, 0x217f), (0x2180, 0x2183), (0x4016, 0x4017)
+    , (0x4200, 0x421f), (0x4300, 0x437f), (0x6000, 0x7fff), (0x8000, 0xffff)) for e in (lo - 1, lo, hi, hi + 1) if 0 <= e <= 0xffff})
+ADDRESSES = [bank << 16 | page for bank in range(0x100) for page in EDGES + list(range(0, 0x10000, 0x80))]
+
+@pytest.mark.parametrize("address, expected", [
+      (0x002100, (5, 0x2100)), (0x80213f, (5, 0x213f)), (0x002184, (None, None)), (0x004016, (5, 0x4016))
+    , (0x00437f, (5, 0x437f)), (0x004380, (None, None)), (0x001fff, (2, 0x1fff)), (0x7e0000, (2, 0))
+    , (0x7fffff, (2, 0x1ffff)), (0x008000, (1, 0x8000)), (0x808000, (1, 0x8000)), (0x400000, (1, 0))
+    , (0xc01234, (1, 0x1234)), (0x206000, (3, 0)), (0xbf7fff, (3, 0x1fff)), (0x006000, (None, None))
+    , (0x7d0000, (1, 0x3d0000)), (0x3f2000, (None, None))])
+def test_map_table(address, expected):
+    assert annotate.ADDRESS_SPACE.map(address) == expected
+    assert deMMIO(address) == expected
+
+def test_map_matches_deMMIO():
+    for address in ADDRESSES:
+        assert annotate.ADDRESS_SPACE.map(address) == deMMIO(address), hex(address)
+
+def test_map_all_matches_deMMIO():
+    maps, addresses = annotate.ADDRESS_SPACE.map_all(ADDRESSES)
+    assert list(zip(maps, addresses)) == [deMMIO(address) for address in ADDRESSES]
+
+def test_map_array_matches_deMMIO():
+    if annotate.numpy is None:
+        pytest.skip("map_array needs numpy")
+    maps, addresses = annotate.ADDRESS_SPACE.map_array(ADDRESSES)
+    # map_array reports unmapped addresses as map 0
+    expected = [deMMIO(address) for address in ADDRESSES]
+    assert maps.tolist() == [m or 0 for m, a in expected]
+    assert [a for a, (m, e) in zip(addresses.tolist(), expected) if m] == [e for m, e in expected if m]
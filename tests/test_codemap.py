@@ -0,0 +1,68 @@
+import pytest
+
+import annotate
+
+# (map, address, m, x) rows of source 1:5, 0x8004 was decoded under two states
+CODE = [(1, 0x8000, 1, 1), (1, 0x8002, 1, 1), (1, 0x8004, 0, 1), (1, 0x8004, 1, 1), (1, 0x8007, 0, 0)
+      , (1, 0x8010, 0, 0), (1, 0x8012, 1, 0), (2, 0x0010, 0, 0), (2, 0x0020, 0, 0)]
+# (map, address, length) data blocks, one at an instruction's address
+BLOCKS = [(1, 0x8004, 3), (1, 0x8008, 8), (1, 0x8020, 2), (3, 0x0000, 4)]
+
+def baseline():
+    # the listing the per-page SQL returned: one row per instruction address (GROUP BY address)
+    # and one per block, ordered by map and address with instructions first
+    code = sorted({(map, address) for map, address, m, x in CODE})
+    items = [(map, address, 0, "code", None) for map, address in code]
+    items += [(map, address, 1, "data", length) for map, address, length in BLOCKS]
+    return [(asmtype, map, address, length) for map, address, order, asmtype, length in sorted(items)]
+
+@pytest.fixture
+def code_map(source_db):
+    source_db.database.executemany("INSERT INTO codemap VALUES (1, 5, ?, ?, ?, ?)", CODE)
+    source_db.database.executemany("INSERT INTO comments VALUES (1, 5, ?, ?, 0, NULL, ?)", BLOCKS)
+    # another source's rows are never part of the listing
+    source_db.database.execute("INSERT INTO codemap VALUES (1, 6, 1, 0x8001, 0, 0)")
+    source_db.database.execute("INSERT INTO comments VALUES (1, 6, 1, 0x8003, 0, NULL, 2)")
+    return annotate.CodeMap(source_db, 1, 5)
+
+def test_maps_and_counts(code_map):
+    items = baseline()
+    assert code_map.maps() == [1, 2, 3]
+    for map in (1, 2, 3, 4):
+        assert code_map.count(map) == sum(1 for item in items if item[1] == map)
+
+def test_nth(code_map):
+    items = baseline()
+    for map in code_map.maps():
+        addresses = [address for asmtype, m, address, length in items if m == map]
+        assert [code_map.nth(map, k) for k in range(len(addresses))] == addresses
+
+@pytest.mark.parametrize("map, address", [(1, 0), (1, 0x8000), (1, 0x8001), (1, 0x8004), (1, 0x8005)
+    , (1, 0x8008), (1, 0x8013), (1, 0x8021), (2, 0x10), (2, 0x21), (3, 0), (3, 1), (4, 0)])
+def test_ordinal_and_contains(code_map, map, address):
+    items = baseline()
+    assert code_map.ordinal(map, address) == sum(1 for item in items if item[1] == map and item[2] < address)
+    assert code_map.contains(map, address) == any(item[1:3] == (map, address) for item in items)
+
+@pytest.mark.parametrize("map, address", [(1, 0x8000), (1, 0x8003), (1, 0x8004), (1, 0x8011), (1, 0x8021), (2, 0), (3, 0)])
+@pytest.mark.parametrize("size", [1, 2, 5, 20])
+def test_page(code_map, map, address, size):
+    # a page runs on into the following maps from their first address
+    items = [item for item in baseline() if (item[1], item[2]) >= (map, address)]
+    rows = code_map.page(map, address, size)
+    assert [(row['asmtype'], row['map'], row['address'], row['length']) for row in rows] == items[:size]
+
+def test_states(code_map):
+    rows = {(row['map'], row['address']):row for row in code_map.page(1, 0, 100) if row['asmtype'] == "code"}
+    for map, address, m, x in CODE:
+        row = rows[(map, address)]
+        assert (m, x) in row['states']
+        if (map, address) != (1, 0x8004):
+            assert (row['m'], row['x']) == (m, x)
+            assert row['states'] == ((m, x),)
+    assert sorted(rows[(1, 0x8004)]['states']) == [(0, 1), (1, 1)]
+
+def test_runs(code_map):
+    # maximal runs of constant state, the multi-state 0x8004 keeps the state the code flows in with
+    assert list(code_map.runs(1)) == [(0x8000, 0x8004, 1, 1), (0x8007, 0x8010, 0, 0), (0x8012, 0x8012, 1, 0)]
+    assert list(code_map.runs(2)) == [(0x10, 0x20, 0, 0)]
@@ -0,0 +1,25 @@
+import pytest
+
+import annotate
+
+@pytest.fixture
+def snapshot(tmp_path, source_db):
+    db = source_db
+    db.database.executemany("INSERT INTO bytes VALUES (1, 5, 1, ?, 0xEA, 1)", [(a,) for a in range(0x8000, 0x8300)])
+    db.database.execute("INSERT INTO sources VALUES (1, 5, 1, 1, 0x300, 0x8000, 0x82ff)")
+    db.database.executemany("INSERT INTO codemap VALUES (1, 5, 1, ?, 1, 1)", [(a,) for a in range(0x8000, 0x8300)])
+    db.database.executemany("INSERT INTO functions VALUES (1, 5, 1, ?, ?, ?, 0)"
+        , [(a, a + 0xff, "function_{:04X}".format(a)) for a in range(0x8000, 0x8300, 0x100)])
+    path = str(tmp_path / "test.snap")
+    annotate.Snapshot.write(path, db)
+    return annotate.SnapshotDB(path)
+
+def test_function_colors_differ(snapshot):
+    snapshot.execute(annotate.ASMView.page_function_query, (1, 5, 1, 0x82ff, 0x8000))
+    colors = [row['color'] for row in snapshot.fetchall()]
+    assert len(colors) == 3
+    assert len(set(colors)) == 3
+
+    summary = annotate.ListingSummary(snapshot, annotate.CodeMap(snapshot, 1, 5))
+    code_bytes, data_bytes, colors, weights = summary.levels[0]
+    assert len(set(colors)) == 3